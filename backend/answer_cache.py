@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on the query embedding.
+
+    A lookup hits when the cosine similarity between the query and a cached query
+    reaches `threshold`. Entries expire after ttl_seconds and the least recently
+    used entry is dropped once max_entries is reached.
+    """
+
+    def __init__(self, embeddings, threshold=0.95, ttl_seconds=3600, max_entries=512):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # query -> (created, unit vector, answer)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypasses = 0
+
+    def embed(self, query):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query, vector=None):
+        """Return (answer or None, query vector). The vector can be passed back to store()."""
+        if vector is None:
+            vector = self.embed(query)
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (created, _, _) in self._entries.items()
+                        if now - created >= self.ttl_seconds]:
+                del self._entries[key]
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.stack([self._entries[k][1] for k in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self._hits += 1
+                    return self._entries[keys[best]][2], vector
+            self._misses += 1
+        return None, vector
+
+    def store(self, query, answer, vector=None):
+        if vector is None:
+            vector = self.embed(query)
+        with self._lock:
+            self._entries.pop(query, None)
+            self._entries[query] = (time.monotonic(), vector, answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bypass(self):
+        """Count a request that was not eligible for the cache."""
+        with self._lock:
+            self._bypasses += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "bypasses": self._bypasses,
+            }
@@ -1,30 +1,39 @@
-import os, json, logging, requests
-import tempfile
+import os, json, logging
 from uuid import uuid4
 import json
 import re
 import base64
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response, stream_with_context
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 
 
 from flask_cors import CORS
-import qdrant_client
-from openai import OpenAI
 from prompts.prompt import engineeredprompt
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from session_store import create_session_store
+from history_compaction import create_history_compactor
+from context_assembly import create_context_assembler
+from answer_cache import SemanticAnswerCache
+from embedding_cache import get_embeddings
+from query_analysis import is_standalone
+from retrieval import RETRIEVAL_MODES, AdaptiveHistoryAwareRetriever, VectorRetriever, mmr_settings
+from sparse_index import create_sparse_index
+from local_replica import create_local_replica
+from tts_cache import create_tts_cache, synthesize
+from speech_pipeline import speak_while_streaming
+from card_router import CardRouter
+from speculative import SpeculativeJobs, content_key
+from http_pool import get_http_client
+from realtime_pool import RealtimeSessionPool, RealtimeSessionError
+from metrics import current_request, instrument_flask, record_stage, registry, stage, upstream_error
+import sse
+from warmup import Lazy, WarmUp, read_queries
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-# NEW IMPORTS
-from langchain_classic.chains import (
-    create_history_aware_retriever,
-    create_retrieval_chain
-)
-
-from langchain.chains.combine_documents import create_stuff_documents_chain
+# langchain_openai, langchain_qdrant and the chain constructors are imported inside the
+# factories below, so importing this module stays cheap (see warmup.py)
 
 
 
@@ -41,20 +50,63 @@ CORS(app, origins=["https://ai-platform-dash.onrender.com", "http://localhost:30
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("rtc-transcribe")
 
+# Per-route latency histograms and per-stage timings (rewrite, embedding, qdrant, ttft, ...)
+# are exported at GET /metrics; see metrics.py.
+instrument_flask(app)
+
 # ==========================================================
 
-chat_sessions = {}
+# Chat history backend (memory | sqlite), see session_store.create_session_store.
+# Use sqlite when running more than one gunicorn worker so follow-ups share history.
+chat_sessions = create_session_store()
+# Only the last HISTORY_WINDOW messages are loaded, then fitted to a token budget (HISTORY COMPACTION below).
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
 collection_name = os.getenv("QDRANT_COLLECTION_NAME")
 
-# Initialize OpenAI client
-client = OpenAI()
+# Initialize OpenAI client (on first use)
+def get_openai_client():
+    from openai import OpenAI
+
+    return OpenAI()
+
+client = Lazy(get_openai_client)
+
+# === HISTORY COMPACTION ===
+# The chain gets the recent turns verbatim within CHAT_HISTORY_TOKENS, older turns as a
+# rolling summary written in the background (see history_compaction.py).
+HISTORY_SUMMARY_MODEL = os.getenv("CHAT_HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+def summarize_history(summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    with stage("history_summary"):
+        completion = client.chat.completions.create(
+            model=HISTORY_SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": (
+                    "You maintain a running summary of a conversation between a user and the "
+                    "Doctor AI platform assistant. Merge the new turns into the summary. Keep facts, "
+                    "names, numbers and open questions the user may refer back to; drop pleasantries. "
+                    "At most 150 words, plain prose."
+                )},
+                {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+            temperature=0,
+            max_tokens=300,
+        )
+    return completion.choices[0].message.content.strip()
+
+history = create_history_compactor(chat_sessions, summarize_history, window=HISTORY_WINDOW)
 
 # Active WebSocket connections to OpenAI
 openai_connections = {}
 
+# Shared by the vector store and the semantic answer cache; repeated queries skip
+# the embeddings round-trip (see embedding_cache.CachedEmbeddings).
+embeddings = get_embeddings()
+
 # === VECTOR STORE & RAG ===
 def get_vector_store():
-    embeddings = OpenAIEmbeddings()
+    from langchain_qdrant import QdrantVectorStore
 
     return QdrantVectorStore.from_existing_collection(
         embedding=embeddings,
@@ -67,18 +119,57 @@ def get_vector_store():
     )
 
 
+# Connects to Qdrant on first use (or during warm-up), not at import
+vector_store = Lazy(get_vector_store)
+# LOCAL_REPLICA_PATH: dense searches run against a synced in-process copy of the collection
+# (python -m local_replica sync) instead of Qdrant; None when unset.
+replica = create_local_replica()
+
+# RETRIEVAL_MODE=hybrid fuses dense search with a local BM25 index (sparse_index.py) by
+# reciprocal rank fusion; requests can override it with "retrieval_mode".
+# RETRIEVAL_MMR=1 re-ranks the retrieved chunks for diversity and drops near-duplicates
+# (see retrieval.mmr_settings); requests can override it with "mmr".
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+sparse_index = create_sparse_index(vector_store, replica)
+
 def get_context_retriever_chain():
+    from langchain_core.runnables import ConfigurableField
+    from langchain_openai import ChatOpenAI
+
     llm = ChatOpenAI(model="gpt-4o")
-    retriever = get_vector_store().as_retriever()
+    retriever = VectorRetriever(
+        vector_store=vector_store, k=4, mode=RETRIEVAL_MODE, sparse_index=sparse_index,
+        replica=replica, embeddings=embeddings, **mmr_settings(),
+    ).configurable_fields(
+        mode=ConfigurableField(id="retrieval_mode", name="Retrieval mode"),
+        mmr=ConfigurableField(id="retrieval_mmr", name="MMR re-ranking"),
+    )
     prompt = ChatPromptTemplate.from_messages([
         MessagesPlaceholder("chat_history"),
         ("user", "{input}"),
         ("user", "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation"),
     ])
-    return create_history_aware_retriever(llm, retriever, prompt)
+    # REWRITE_MODE=adaptive skips the rewrite LLM call for standalone questions; "always" rewrites every follow-up;
+    # "parallel" also searches the raw input while the rewrite runs (REWRITE_DEADLINE_MS caps the wait)
+    return AdaptiveHistoryAwareRetriever(
+        llm, retriever, prompt,
+        mode=os.getenv("REWRITE_MODE", "adaptive"),
+        deadline=float(os.getenv("REWRITE_DEADLINE_MS", "1500")) / 1000,
+    )
+
+context_retriever = Lazy(get_context_retriever_chain)
+
+# Retrieved chunks are ordered, cut at a score gap, stripped of boilerplate and trimmed to
+# CONTEXT_TOKENS before they are stuffed into {context}; see context_assembly.py
+context_assembler = create_context_assembler(history.counter)
 
 def get_conversational_rag_chain():
-    retriever_chain = get_context_retriever_chain()
+    from langchain_classic.chains import create_retrieval_chain
+    from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+    from langchain_core.runnables import RunnableLambda
+    from langchain_openai import ChatOpenAI
+
+    retriever_chain = context_retriever.as_runnable() | RunnableLambda(context_assembler.assemble)
     llm = ChatOpenAI(model="gpt-4o")
     prompt = ChatPromptTemplate.from_messages([
         ("system", engineeredprompt),
@@ -87,7 +178,117 @@ def get_conversational_rag_chain():
     ])
     return create_retrieval_chain(retriever_chain, create_stuff_documents_chain(llm, prompt))
 
-conversation_rag_chain = get_conversational_rag_chain()
+conversation_rag_chain = Lazy(get_conversational_rag_chain)
+
+# === SEMANTIC ANSWER CACHE ===
+# Serves repeated first-turn / standalone questions without touching the RAG chain.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+answer_cache = SemanticAnswerCache(
+    embeddings,
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX", "512")),
+)
+
+def cached_answer(chat_history, user_input):
+    """
+    Returns (answer, vector). answer is None on a miss; vector is None when the
+    question is not cacheable (follow-up that depends on the history).
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    if chat_history and not is_standalone(user_input):
+        answer_cache.bypass()
+        return None, None
+    try:
+        return answer_cache.lookup(user_input)
+    except Exception as e:
+        log.warning("Answer cache lookup failed: %s", e)
+        return None, None
+
+def replay_stream(answer):
+    # Re-emit a cached answer word by word so the client sees the usual stream.
+    for token in re.findall(r"\S+\s*|\s+", answer):
+        yield token
+
+def retrieval_config(data):
+    """Returns (chain config, error) for optional "retrieval_mode" / "mmr" in a request body."""
+    configurable = {}
+    mode = data.get("retrieval_mode")
+    if mode is not None:
+        if mode not in RETRIEVAL_MODES:
+            return None, f"Unsupported retrieval_mode: {mode} (use one of {', '.join(RETRIEVAL_MODES)})"
+        configurable["retrieval_mode"] = mode
+    mmr = data.get("mmr")
+    if mmr is not None:
+        if not isinstance(mmr, bool):
+            return None, "mmr must be true or false"
+        configurable["retrieval_mmr"] = mmr
+    return ({"configurable": configurable} if configurable else {}), None
+
+def source_list(docs):
+    """Metadata of the retrieved chunks, for the SSE "sources" event."""
+    return [{k: v for k, v in doc.metadata.items() if k != "_collection_name"} for doc in docs]
+
+def answer_events(session_id, user_input, config=None):
+    """
+    Yields (event, data) for one answer: "sources", "token"s, "error", "timing", "done".
+    Records the turn when done; answer_stream() and the SSE mode of /stream both use it.
+    """
+    chat_history = history.get(session_id)
+    start = time.perf_counter()
+    ttft = None
+    hit, vector = cached_answer(chat_history, user_input)
+    if hit is not None:
+        for token in replay_stream(hit):
+            yield "token", token
+        chat_sessions.append(session_id, user_input, hit)
+        speculate(session_id, user_input, hit)
+        yield "timing", {"cached": True, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+        yield "done", {"session_id": session_id}
+        return
+
+    answer = ""
+    try:
+        for chunk in conversation_rag_chain.stream(
+            {"chat_history": chat_history, "input": user_input}, config=config
+        ):
+            if chunk.get("context"):
+                yield "sources", source_list(chunk["context"])
+            token = chunk.get("answer", "")
+            if token and not answer:
+                ttft = time.perf_counter() - start
+                record_stage("ttft", ttft)
+            answer += token
+            if token:
+                yield "token", token
+    except Exception as e:
+        upstream_error("rag_chain")
+        yield "error", {"message": str(e)}
+    else:
+        record_stage("generation", time.perf_counter() - start)
+        if vector is not None and answer:
+            answer_cache.store(user_input, answer, vector)
+        speculate(session_id, user_input, answer)
+
+    chat_sessions.append(session_id, user_input, answer)
+    timings = current_request()
+    yield "timing", {
+        "cached": False,
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        "stages_ms": {name: round(sec * 1000, 1) for name, sec in timings.stages.items()} if timings else {},
+        "context": timings.notes.get("context") if timings else None,
+    }
+    yield "done", {"session_id": session_id}
+
+def answer_stream(session_id, user_input, config=None):
+    """Yields answer tokens (cache replay or RAG chain) and records the turn when done."""
+    for event, data in answer_events(session_id, user_input, config):
+        if event == "token":
+            yield data
+        elif event == "error":
+            yield f"\n[Vector error: {data['message']}]"
 
 # === Standard HTTP Routes ===
 @app.route("/")
@@ -101,27 +302,18 @@ def stream():
     user_input = data.get("message")
     if not user_input:
         return jsonify({"error": "No input message"}), 400
-
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = []
-
-    def generate():
-        answer = ""
-        try:
-            for chunk in conversation_rag_chain.stream(
-                {"chat_history": chat_sessions[session_id], "input": user_input}
-            ):
-                token = chunk.get("answer", "")
-                answer += token
-                yield token
-        except Exception as e:
-            yield f"\n[Vector error: {str(e)}]"
-
-        chat_sessions[session_id].append({"role": "user", "content": user_input})
-        chat_sessions[session_id].append({"role": "assistant", "content": answer})
-
-    return Response(stream_with_context(generate()), content_type="text/plain")
-
+    config, error = retrieval_config(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # "format": "sse" (or Accept: text/event-stream) streams typed events with coalesced
+    # tokens and heartbeats instead of raw text; see sse.py
+    if sse.wants_sse(data, request.headers.get("Accept")):
+        return Response(
+            stream_with_context(sse.sse_stream(answer_events(session_id, user_input, config))),
+            mimetype="text/event-stream", headers=sse.HEADERS,
+        )
+    return Response(stream_with_context(answer_stream(session_id, user_input, config)), content_type="text/plain")
 
 @app.route("/generate", methods=["POST"])
 def generate():
@@ -130,15 +322,45 @@ def generate():
     user_input = data.get("message", "")
     if not user_input:
         return jsonify({"error": "No input message"}), 400
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = []
-    response = conversation_rag_chain.invoke(
-        {"chat_history": chat_sessions[session_id], "input": user_input}
-    )
-    answer = response["answer"]
-    chat_sessions[session_id].append({"role": "user", "content": user_input})
-    chat_sessions[session_id].append({"role": "assistant", "content": answer})
-    return jsonify({"response": answer, "session_id": session_id})
+    config, error = retrieval_config(data)
+    if error:
+        return jsonify({"error": error}), 400
+    chat_history = history.get(session_id)
+    answer, vector = cached_answer(chat_history, user_input)
+    if answer is None:
+        with stage("generation"):
+            response = conversation_rag_chain.invoke(
+                {"chat_history": chat_history, "input": user_input}, config=config
+            )
+        answer = response["answer"]
+        if vector is not None and answer:
+            answer_cache.store(user_input, answer, vector)
+    chat_sessions.append(session_id, user_input, answer)
+    speculate(session_id, user_input, answer)
+    resp = jsonify({"response": answer, "session_id": session_id})
+    timings = current_request()
+    context = timings.notes.get("context") if timings else None
+    if context:
+        resp.headers["X-Context-Tokens"] = f"{context['tokens_in']};sent={context['tokens_out']}"
+    return resp
+
+# Synthesized audio is cached on disk by (text, model, voice, format); see tts_cache.py
+tts_cache = create_tts_cache()
+
+def speech_bytes(text, voice="fable", fmt="mp3"):
+    cached = tts_cache and tts_cache.open(text, "tts-1", voice, fmt)
+    if cached:
+        with cached:
+            return cached.read()
+    try:
+        with stage("tts"):
+            audio_bytes = synthesize(client, text, model="tts-1", voice=voice, fmt=fmt)
+    except Exception:
+        upstream_error("tts")
+        raise
+    if tts_cache:
+        tts_cache.put(text, "tts-1", voice, fmt, audio_bytes)
+    return audio_bytes
 
 @app.route("/tts", methods=["POST"])
 def tts():
@@ -146,69 +368,245 @@ def tts():
     if not text:
         return jsonify({"error": "No text supplied"}), 400
 
-    response = client.audio.speech.create(
-        model="tts-1",
-        voice="fable",
-        input=text
-    )
-    # Using a temporary file to handle the audio stream
-    with tempfile.NamedTemporaryFile(delete=True, suffix='.mp3') as fp:
-        response.stream_to_file(fp.name)
-        fp.seek(0)
-        audio_bytes = fp.read()
-    
-    audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
+    audio_base64 = base64.b64encode(speech_bytes(text)).decode("utf-8")
     return jsonify({"audio_base64": audio_base64})
 
+# Streaming TTS: audio is passed through as chunked binary as it arrives (no temp file, no base64)
+TTS_MIMETYPES = {"opus": "audio/ogg", "aac": "audio/aac", "mp3": "audio/mpeg"}
+TTS_VOICES = {"alloy", "ash", "ballad", "coral", "echo", "fable", "nova", "onyx", "sage", "shimmer"}
+TTS_CHUNK_SIZE = 4096
+
+def tts_options(data):
+    """Returns (text, voice, fmt, error) for a /tts/stream request body."""
+    text = (data.get("text") or "").strip()
+    voice = data.get("voice", "fable")
+    fmt = data.get("format", "opus")
+    if not text:
+        return text, voice, fmt, "No text supplied"
+    if voice not in TTS_VOICES:
+        return text, voice, fmt, f"Unsupported voice: {voice}"
+    if fmt not in TTS_MIMETYPES:
+        return text, voice, fmt, f"Unsupported format: {fmt} (use one of {', '.join(TTS_MIMETYPES)})"
+    return text, voice, fmt, None
+
+@app.route("/tts/stream", methods=["POST"])
+def tts_stream():
+    text, voice, fmt, error = tts_options(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    # An open handle, so a file evicted by another worker after the lookup still sends
+    cached = tts_cache and tts_cache.open(text, "tts-1", voice, fmt)
+    if cached:
+        return send_file(cached, mimetype=TTS_MIMETYPES[fmt], max_age=0)
+
+    # Open the upstream stream before answering so errors still surface as a JSON 502
+    try:
+        with stage("tts_connect"):
+            upstream = client.audio.speech.with_streaming_response.create(
+                model="tts-1",
+                voice=voice,
+                input=text,
+                response_format=fmt,
+            ).__enter__()
+    except Exception as e:
+        upstream_error("tts")
+        log.exception("TTS stream error")
+        return jsonify({"error": f"TTS error: {e}"}), 502
+
+    def generate():
+        chunks = []
+        try:
+            for chunk in upstream.iter_bytes(TTS_CHUNK_SIZE):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            upstream.close()
+        if tts_cache:
+            tts_cache.put(text, "tts-1", voice, fmt, b"".join(chunks))
+
+    resp = Response(stream_with_context(generate()), mimetype=TTS_MIMETYPES[fmt])
+    # A generator that never started (client gone before the first chunk) skips its finally
+    resp.call_on_close(upstream.close)
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# Spoken answers: each finished sentence of the /stream answer is synthesized while
+# generation continues. The response is NDJSON with interleaved events:
+#   {"type": "text", "delta": "..."}
+#   {"type": "audio", "index": 0, "text": "...", "format": "mp3", "audio_base64": "..."}
+#   {"type": "audio_error", "index": 1}      synthesis of that sentence failed
+#   {"type": "error", "message": "..."}      the answer failed (never spoken)
+#   {"type": "done", "session_id": "..."}
+speech_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPEECH_TTS_WORKERS", "8")), thread_name_prefix="speech"
+)
+
+def speech_options(data):
+    """Returns (session_id, user_input, voice, fmt, config, error) for a /stream/speech body."""
+    session_id = data.get("session_id", str(uuid4()))
+    user_input = data.get("message")
+    if not user_input:
+        return session_id, user_input, None, None, None, "No input message"
+    _, voice, fmt, error = tts_options({**data, "text": user_input, "format": data.get("format", "mp3")})
+    if error:
+        return session_id, user_input, voice, fmt, None, error
+    config, error = retrieval_config(data)
+    return session_id, user_input, voice, fmt, config, error
+
+def speech_line(event, fmt):
+    """NDJSON line for a speak_while_streaming() event; None for events the client does not get."""
+    kind = event[0]
+    if kind == "text":
+        line = {"type": "text", "delta": event[1]}
+    elif kind == "audio":
+        _, index, sentence, audio = event
+        line = {
+            "type": "audio",
+            "index": index,
+            "text": sentence,
+            "format": fmt,
+            "audio_base64": base64.b64encode(audio).decode("utf-8"),
+        }
+    elif kind == "audio_error":
+        _, index, _, error = event
+        log.warning("TTS for sentence %d failed: %s", index, error)
+        line = {"type": "audio_error", "index": index}
+    elif kind == "error":
+        line = {"type": "error", "message": event[1]["message"]}
+    else:
+        return None
+    return json.dumps(line) + "\n"
+
+@app.route("/stream/speech", methods=["POST"])
+def stream_speech():
+    session_id, user_input, voice, fmt, config, error = speech_options(request.get_json() or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    def generate():
+        events = speak_while_streaming(
+            answer_events(session_id, user_input, config),
+            lambda sentence: speech_bytes(sentence, voice, fmt),
+            speech_executor,
+        )
+        try:
+            for event in events:
+                line = speech_line(event, fmt)
+                if line:
+                    yield line
+        except Exception as e:
+            log.warning("Speech stream failed: %s", e)
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        yield json.dumps({"type": "done", "session_id": session_id}) + "\n"
+
+    resp = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
 @app.route("/reset", methods=["POST"])
 def reset():
     session_id = request.json.get("session_id")
-    if session_id in chat_sessions:
-        del chat_sessions[session_id]
+    chat_sessions.reset(session_id)
+    history.forget(session_id)
+    speculative_jobs.discard_session(session_id)
     return jsonify({"message": "Session reset"}), 200
 
-@app.route("/generate-followups", methods=["POST"])
-def generate_followups():
-    data = request.get_json()
-    last_answer = data.get("last_answer", "")
-    if not last_answer:
-        return jsonify({"followups": []})
-
+registry.register_collector("chat_sessions", chat_sessions.stats)
+registry.register_collector("history", history.stats)
+registry.register_collector("context", context_assembler.stats)
+registry.register_collector("answer_cache", answer_cache.stats)
+registry.register_collector("embedding_cache", embeddings.stats)
+registry.register_collector("sparse_index", sparse_index.stats)
+registry.register_collector("sse", sse.stats)
+if replica:
+    registry.register_collector("local_replica", replica.stats)
+if tts_cache:
+    registry.register_collector("tts_cache", tts_cache.stats)
+
+@app.get("/api/sessions/stats")
+def session_stats():
+    return jsonify(chat_sessions.stats())
+
+@app.get("/api/history/stats")
+def history_stats():
+    return jsonify(history.stats())
+
+@app.get("/api/context/stats")
+def context_stats():
+    return jsonify(context_assembler.stats())
+
+@app.get("/api/answer-cache/stats")
+def answer_cache_stats():
+    return jsonify(answer_cache.stats())
+
+@app.get("/api/sse/stats")
+def sse_stats():
+    return jsonify(sse.stats())
+
+@app.get("/api/sparse-index/stats")
+def sparse_index_stats():
+    return jsonify(sparse_index.stats())
+
+@app.get("/api/local-replica/stats")
+def local_replica_stats():
+    return jsonify(replica.stats() if replica else {"enabled": False})
+
+@app.get("/api/embedding-cache/stats")
+def embedding_cache_stats():
+    return jsonify(embeddings.stats())
+
+@app.get("/api/tts-cache/stats")
+def tts_cache_stats():
+    return jsonify(tts_cache.stats() if tts_cache else {"enabled": False})
+
+def followup_messages(last_answer):
     followup_prompt = (
         f"Based on the following assistant response, generate 3 short and helpful follow-up questions "
         f"that the user might want to ask next:\n\n{last_answer}\n\n"
         f"Format the response as a JSON array of strings."
     )
-
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": followup_prompt}
+    ]
+
+def parse_followups(text):
+    # A more robust way to find and parse the JSON array
+    match = re.search(r'\[.*?\]', text.strip(), re.DOTALL)
+    if match:
+        return json.loads(match.group(0))
+    return []
+
+def compute_followups(last_answer):
     try:
         completion = client.chat.completions.create(
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": followup_prompt}
-            ],
+            messages=followup_messages(last_answer),
             temperature=0.7
         )
-
-        text = completion.choices[0].message.content.strip()
-        # A more robust way to find and parse the JSON array
-        match = re.search(r'\[.*?\]', text, re.DOTALL)
-        if match:
-            questions = json.loads(match.group(0))
-        else:
-            questions = []
-        return jsonify({"followups": questions})
+        return parse_followups(completion.choices[0].message.content)
 
     except Exception as e:
+        upstream_error("followups")
         print(f"Error generating followups: {e}")
-        return jsonify({"followups": []})
+        return []
 
-@app.route("/classify", methods=["POST"])
-def classify_question():
+@app.route("/generate-followups", methods=["POST"])
+def generate_followups():
     data = request.get_json()
-    question = data.get("question")
-    ai_response = data.get("ai_response")
+    last_answer = data.get("last_answer", "")
+    if not last_answer:
+        return jsonify({"followups": []})
+
+    # Usually already computed (or in flight) since the answer finished streaming
+    job = speculative_jobs.run(
+        content_key("followups", last_answer), lambda: compute_followups(last_answer)
+    )
+    return jsonify({"followups": job.result()})
 
+def classify_messages(question, ai_response):
     prompt = f"""
 You are an intelligent AI routing assistant. Given a user's question and AI response,
 determine the most relevant card ID from the following:
@@ -226,33 +624,168 @@ Return only the ID as a number (1-7). No text, no explanation.
 Question: {question}
 Response: {ai_response}
 """
+    return [{"role": "system", "content": prompt}]
 
+def parse_card_id(text):
+    try:
+        return int(text.strip())
+    except:
+        return None
+
+def llm_classify(question, ai_response):
     completion = client.chat.completions.create(
         model="gpt-4o",
-        messages=[{"role": "system", "content": prompt}],
+        messages=classify_messages(question, ai_response),
         temperature=0.0,
     )
+    return parse_card_id(completion.choices[0].message.content)
+
+# Local nearest-centroid card routing; gpt-4o is only asked when the router is unsure
+card_router = CardRouter(
+    embeddings,
+    min_score=float(os.getenv("CARD_ROUTER_MIN_SCORE", "0.75")),
+    min_margin=float(os.getenv("CARD_ROUTER_MIN_MARGIN", "0.02")),
+)
 
-    result = completion.choices[0].message.content.strip()
+def compute_classification(question, ai_response):
     try:
-        card_id = int(result)
-    except:
-        card_id = None
+        return card_router.classify(
+            question, ai_response, fallback=lambda: llm_classify(question, ai_response)
+        )
+    except Exception as e:
+        log.warning("Card router failed, using LLM: %s", e)
+        return {"card_id": llm_classify(question, ai_response), "routed_by": "llm"}
+
+@app.route("/classify", methods=["POST"])
+def classify_question():
+    data = request.get_json()
+    question = data.get("question")
+    ai_response = data.get("ai_response")
+
+    job = speculative_jobs.run(
+        content_key("classify", question, ai_response),
+        lambda: compute_classification(question, ai_response),
+    )
+    return jsonify(job.result())
+
+registry.register_collector("card_router", card_router.stats)
+
+@app.get("/api/card-router/stats")
+def card_router_stats():
+    return jsonify(card_router.stats())
+
+# === SPECULATIVE FOLLOW-UPS / CLASSIFICATION ===
+# The frontend sends every finished answer back to /classify, so classification is started
+# in the background as soon as the answer is complete. SPECULATIVE_KINDS picks the jobs
+# ("classify,followups" also precomputes /generate-followups, which the chat UI does not call).
+SPECULATIVE_ENABLED = os.getenv("SPECULATIVE_ENABLED", "1") == "1"
+SPECULATIVE_KINDS = {k.strip() for k in os.getenv("SPECULATIVE_KINDS", "classify").split(",") if k.strip()}
+speculative_jobs = SpeculativeJobs(
+    max_workers=int(os.getenv("SPECULATIVE_WORKERS", "8")),
+    ttl_seconds=int(os.getenv("SPECULATIVE_TTL", "300")),
+)
+
+def speculate(session_id, question, answer):
+    if not SPECULATIVE_ENABLED or not answer:
+        return
+    if "followups" in SPECULATIVE_KINDS:
+        speculative_jobs.start(
+            content_key("followups", answer), lambda: compute_followups(answer), session_id
+        )
+    if "classify" in SPECULATIVE_KINDS:
+        speculative_jobs.start(
+            content_key("classify", question, answer),
+            lambda: compute_classification(question, answer),
+            session_id,
+        )
+
+registry.register_collector("speculative", speculative_jobs.stats)
 
-    return jsonify({"card_id": card_id})
+@app.get("/api/speculative/stats")
+def speculative_stats():
+    return jsonify(speculative_jobs.stats())
 
 # === Real-Time Transcription with OpenAI's API Using WebRTC ===
-OAI_BASE = "https://api.openai.com/v1"
+# Pooled keep-alive session: both upstream calls reuse warm connections to api.openai.com
+http_client = get_http_client()
+registry.register_collector("http_pool", http_client.stats)
+
+@app.get("/api/http-pool/stats")
+def http_pool_stats():
+    return jsonify(http_client.stats())
+
+# OPENAI_BASE_URL (also honoured by the OpenAI SDK) can point at a local stand-in
+OAI_BASE = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
 COMMON_JSON_HEADERS = {
     "Authorization": f"Bearer {OPENAI_API_KEY}",
     "Content-Type": "application/json",
     "OpenAI-Beta": "realtime=v1",
 }
 
+# Ephemeral transcription session created in step 1 of rtc_transcribe_connect.
+# NOTE: Do NOT force input_audio_format here; WebRTC uses RTP/Opus.
+TRANSCRIPTION_SESSION_PAYLOAD = {
+    "input_audio_transcription": {
+        "model": "gpt-4o-transcribe"
+    },
+    "turn_detection": {
+        "type": "server_vad",
+        "threshold": 0.5,
+        "prefix_padding_ms": 300,
+        "silence_duration_ms": 500
+    },
+    "input_audio_noise_reduction": {"type": "near_field"}
+}
+
+# Keeps REALTIME_POOL_SIZE unexpired transcription sessions ready (0 disables pre-warming)
+transcription_pool = RealtimeSessionPool(
+    http_client,
+    f"{OAI_BASE}/realtime/transcription_sessions",
+    COMMON_JSON_HEADERS,
+    TRANSCRIPTION_SESSION_PAYLOAD,
+    size=int(os.getenv("REALTIME_POOL_SIZE", "1")),
+    margin=float(os.getenv("REALTIME_POOL_MARGIN", "15")),
+    name="transcription",
+)
+
+registry.register_collector("transcription_pool", transcription_pool.stats)
+
+@app.get("/api/realtime-pool/stats")
+def realtime_pool_stats():
+    return jsonify(transcription_pool.stats())
+
 @app.get("/api/health")
 def health():
     return {"ok": True}
 
+# === WARM-UP / READINESS ===
+# Builds the lazy clients and primes the caches in the background right after start;
+# /api/ready answers 503 until every step has succeeded (failed steps are retried).
+warmup = WarmUp("chat")
+warmup.step("embeddings", lambda: embeddings.embed_documents(["warm-up"] + read_queries()))
+if replica:
+    # Qdrant is only needed when nothing has been synced yet
+    warmup.step("replica", lambda: replica.get() or vector_store.get())
+else:
+    warmup.step("qdrant", vector_store.get)
+warmup.step("rag_chain", conversation_rag_chain.get)
+if RETRIEVAL_MODE != "dense":
+    warmup.step("bm25", sparse_index.get)
+warmup.step("tokenizer", lambda: history.counter.count("warm-up"))
+warmup.step("openai", lambda: client.models.list())
+warmup.step("card_router", lambda: card_router.scores("warm-up"))
+warmup.step("transcription_pool", transcription_pool.start)
+
+@app.before_request
+def start_warmup():
+    warmup.ensure_started()
+
+@app.get("/api/ready")
+def ready():
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+warmup.ensure_started()
+
 @app.post("/api/rtc-transcribe-connect")
 def rtc_transcribe_connect():
     """
@@ -267,42 +800,13 @@ def rtc_transcribe_connect():
     if not offer_sdp:
         return Response(b"No SDP provided", status=400, mimetype="text/plain")
 
-    # 1) Create ephemeral transcription session
-    # NOTE: Do NOT force input_audio_format here; WebRTC uses RTP/Opus.
-    session_payload = {
-        "input_audio_transcription": {
-            "model": "gpt-4o-transcribe"
-        },
-        "turn_detection": {
-            "type": "server_vad",
-            "threshold": 0.5,
-            "prefix_padding_ms": 300,
-            "silence_duration_ms": 500
-        },
-        "input_audio_noise_reduction": {"type": "near_field"}
-    }
-
+    # 1) Ephemeral transcription session (pre-warmed by transcription_pool when possible)
     try:
-        sess = requests.post(
-            f"{OAI_BASE}/realtime/transcription_sessions",
-            headers=COMMON_JSON_HEADERS,
-            data=json.dumps(session_payload),
-            timeout=20
-        )
-    except Exception as e:
-        log.exception("Failed to create transcription session")
-        return Response(f"Session error: {e}".encode(), status=502, mimetype="text/plain")
-
-    if not sess.ok:
-        log.error("Session create failed (%s): %s", sess.status_code, sess.text)
-        return Response(sess.content or b"Failed to create session",
-                        status=sess.status_code,
-                        mimetype="text/plain")
-
-    client_secret = (sess.json().get("client_secret") or {}).get("value")
-    if not client_secret:
-        log.error("Missing client_secret in session response")
-        return Response(b"Missing client_secret", status=502, mimetype="text/plain")
+        with stage("session"):
+            client_secret = transcription_pool.acquire()
+    except RealtimeSessionError as e:
+        log.error("Failed to create transcription session: %s", e)
+        return Response(e.body or str(e).encode(), status=e.status, mimetype="text/plain")
 
     # 2) Exchange SDP with Realtime endpoint using ephemeral secret
     sdp_headers = {
@@ -317,18 +821,20 @@ def rtc_transcribe_connect():
              upstream_url, params, len(offer_sdp or b""))
 
     try:
-        ans = requests.post(
-            upstream_url,
-            params=params,
-            headers=sdp_headers,
-            data=offer_sdp,   # send EXACT bytes we received
-            timeout=30
-        )
+        with stage("sdp_exchange"):
+            ans = http_client.post(
+                upstream_url,
+                params=params,
+                headers=sdp_headers,
+                data=offer_sdp,   # send EXACT bytes we received
+                timeout=30
+            )
     except Exception as e:
         log.exception("SDP exchange error")
         return Response(f"SDP exchange error: {e}".encode(), status=502, mimetype="text/plain")
 
     if not ans.ok:
+        upstream_error("sdp_exchange")
         log.error("SDP exchange failed (%s): %s", ans.status_code, ans.text)
         # surface upstream body (could be helpful error text)
         return Response(ans.content or b"SDP exchange failed",
@@ -0,0 +1,597 @@
+"""
+Async (ASGI) serving mode for the chat routes in app.py and the voice routes in voice.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5050 --workers 2
+
+Upstream I/O goes through AsyncOpenAI, a shared httpx.AsyncClient and AsyncQdrantClient,
+and /stream is an async generator, so one worker keeps hundreds of open streams instead
+of one per thread. The Flask mode (python app.py / gunicorn app:app) keeps working as before;
+prompts, payloads, caches and the session store are shared with it.
+"""
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import time
+from uuid import uuid4
+
+import httpx
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient, models
+from quart import Quart, request, jsonify, Response, send_file
+from quart_cors import cors
+
+import app as chat
+import voice
+from metrics import current_request, instrument_quart, record_stage, stage, upstream_error
+from realtime_pool import RealtimeSessionError
+from retrieval import metadata_filter, payload_selector
+from speech_pipeline import aspeak_while_streaming
+import sse
+
+app = Quart(__name__)
+app = cors(app, allow_origin=["https://ai-platform-dash.onrender.com", "http://localhost:3000"])
+
+log = logging.getLogger("asgi")
+
+# Same histograms as the Flask mode, at GET /metrics (stats collectors are registered by app.py/voice.py)
+instrument_quart(app)
+
+client = AsyncOpenAI()
+qdrant = AsyncQdrantClient(url=os.getenv("QDRANT_HOST"), api_key=os.getenv("QDRANT_API_KEY"))
+http = None  # httpx.AsyncClient, opened per worker in startup()
+
+
+@app.before_serving
+async def startup():
+    global http
+    http = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("ASGI_HTTP_MAX_CONNECTIONS", "200")),
+            max_keepalive_connections=int(os.getenv("ASGI_HTTP_MAX_KEEPALIVE", "50")),
+        ),
+    )
+    # Per worker: builds app.py / voice.py's lazy clients in the background (see warmup.py)
+    chat.warmup.ensure_started()
+    voice.warmup.ensure_started()
+
+
+@app.after_serving
+async def shutdown():
+    await http.aclose()
+    await qdrant.close()
+
+
+@app.route("/")
+async def index():
+    return "Real-time transcription server is running (ASGI)."
+
+
+@app.get("/api/health")
+async def health():
+    return {"ok": True}
+
+
+@app.get("/api/ready")
+async def ready():
+    status = {"chat": chat.warmup.status(), "voice": voice.warmup.status()}
+    ok = chat.warmup.ready and voice.warmup.ready
+    return jsonify({"ready": ok, **status}), 200 if ok else 503
+
+
+# === Chat ===
+async def answer_events(session_id, user_input, config=None):
+    """Same events as chat.answer_events, from the async chain."""
+    chat_history = await asyncio.to_thread(chat.history.get, session_id)
+    hit, vector = await asyncio.to_thread(chat.cached_answer, chat_history, user_input)
+    start = time.perf_counter()
+    if hit is not None:
+        for token in chat.replay_stream(hit):
+            yield "token", token
+        await asyncio.to_thread(chat.chat_sessions.append, session_id, user_input, hit)
+        chat.speculate(session_id, user_input, hit)
+        yield "timing", {"cached": True, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+        yield "done", {"session_id": session_id}
+        return
+
+    answer = ""
+    ttft = None
+    try:
+        async for chunk in chat.conversation_rag_chain.astream(
+            {"chat_history": chat_history, "input": user_input}, config=config
+        ):
+            if chunk.get("context"):
+                yield "sources", chat.source_list(chunk["context"])
+            token = chunk.get("answer", "")
+            if token and not answer:
+                ttft = time.perf_counter() - start
+                record_stage("ttft", ttft)
+            answer += token
+            if token:
+                yield "token", token
+    except Exception as e:
+        upstream_error("rag_chain")
+        yield "error", {"message": str(e)}
+    else:
+        record_stage("generation", time.perf_counter() - start)
+        if vector is not None and answer:
+            chat.answer_cache.store(user_input, answer, vector)
+        chat.speculate(session_id, user_input, answer)
+
+    await asyncio.to_thread(chat.chat_sessions.append, session_id, user_input, answer)
+    timings = current_request()
+    yield "timing", {
+        "cached": False,
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        "stages_ms": {name: round(sec * 1000, 1) for name, sec in timings.stages.items()} if timings else {},
+        "context": timings.notes.get("context") if timings else None,
+    }
+    yield "done", {"session_id": session_id}
+
+
+@app.route("/stream", methods=["POST"])
+async def stream():
+    data = await request.get_json()
+    session_id = data.get("session_id", str(uuid4()))
+    user_input = data.get("message")
+    if not user_input:
+        return jsonify({"error": "No input message"}), 400
+    config, error = chat.retrieval_config(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    async def text():
+        async for event, data in answer_events(session_id, user_input, config):
+            if event == "token":
+                yield data
+            elif event == "error":
+                yield f"\n[Vector error: {data['message']}]"
+
+    if sse.wants_sse(data, request.headers.get("Accept")):
+        return Response(sse.asse_stream(answer_events(session_id, user_input, config)),
+                        mimetype="text/event-stream", headers=sse.HEADERS)
+    return Response(text(), content_type="text/plain")
+
+
+@app.route("/generate", methods=["POST"])
+async def generate():
+    data = await request.get_json()
+    session_id = data.get("session_id", str(uuid4()))
+    user_input = data.get("message", "")
+    if not user_input:
+        return jsonify({"error": "No input message"}), 400
+    config, error = chat.retrieval_config(data)
+    if error:
+        return jsonify({"error": error}), 400
+    chat_history = await asyncio.to_thread(chat.history.get, session_id)
+    answer, vector = await asyncio.to_thread(chat.cached_answer, chat_history, user_input)
+    if answer is None:
+        with stage("generation"):
+            response = await chat.conversation_rag_chain.ainvoke(
+                {"chat_history": chat_history, "input": user_input}, config=config
+            )
+        answer = response["answer"]
+        if vector is not None and answer:
+            chat.answer_cache.store(user_input, answer, vector)
+    await asyncio.to_thread(chat.chat_sessions.append, session_id, user_input, answer)
+    chat.speculate(session_id, user_input, answer)
+    resp = jsonify({"response": answer, "session_id": session_id})
+    timings = current_request()
+    context = timings.notes.get("context") if timings else None
+    if context:
+        resp.headers["X-Context-Tokens"] = f"{context['tokens_in']};sent={context['tokens_out']}"
+    return resp
+
+
+def _read_cached(text, tts_voice, fmt):
+    """TTS cache bytes, or None; the file is opened in the lookup so eviction can't race it."""
+    cached = chat.tts_cache and chat.tts_cache.open(text, "tts-1", tts_voice, fmt)
+    if cached:
+        with cached:
+            return cached.read()
+    return None
+
+
+@app.route("/tts", methods=["POST"])
+async def tts():
+    text = ((await request.get_json()) or {}).get("text", "").strip()
+    if not text:
+        return jsonify({"error": "No text supplied"}), 400
+
+    audio_bytes = await speech_audio(text)
+    audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
+    return jsonify({"audio_base64": audio_base64})
+
+
+class _ClosingBody:
+    """Async response body that also closes `upstream` if it is closed before it starts."""
+
+    def __init__(self, body, upstream):
+        self._body = body
+        self._upstream = upstream
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._body.__anext__()
+
+    async def aclose(self):
+        try:
+            await self._body.aclose()
+        finally:
+            await self._upstream.close()
+
+
+@app.route("/tts/stream", methods=["POST"])
+async def tts_stream():
+    text, tts_voice, fmt, error = chat.tts_options((await request.get_json(silent=True)) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    cached = await asyncio.to_thread(_read_cached, text, tts_voice, fmt)
+    if cached is not None:
+        return await send_file(io.BytesIO(cached), mimetype=chat.TTS_MIMETYPES[fmt])
+
+    try:
+        with stage("tts_connect"):
+            upstream = await client.audio.speech.with_streaming_response.create(
+                model="tts-1",
+                voice=tts_voice,
+                input=text,
+                response_format=fmt,
+            ).__aenter__()
+    except Exception as e:
+        upstream_error("tts")
+        log.exception("TTS stream error")
+        return jsonify({"error": f"TTS error: {e}"}), 502
+
+    async def generate():
+        chunks = []
+        try:
+            async for chunk in upstream.iter_bytes(chat.TTS_CHUNK_SIZE):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await upstream.close()
+        if chat.tts_cache:
+            await asyncio.to_thread(chat.tts_cache.put, text, "tts-1", tts_voice, fmt, b"".join(chunks))
+
+    # An async generator that never started skips its finally; the wrapper closes upstream
+    resp = Response(_ClosingBody(generate(), upstream), mimetype=chat.TTS_MIMETYPES[fmt])
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+async def speech_audio(text, tts_voice="fable", fmt="mp3"):
+    """Async counterpart of chat.speech_bytes: TTS disk cache, else AsyncOpenAI."""
+    cached = await asyncio.to_thread(_read_cached, text, tts_voice, fmt)
+    if cached is not None:
+        return cached
+    try:
+        with stage("tts"):
+            response = await client.audio.speech.create(
+                model="tts-1", voice=tts_voice, input=text, response_format=fmt
+            )
+    except Exception:
+        upstream_error("tts")
+        raise
+    if chat.tts_cache:
+        await asyncio.to_thread(chat.tts_cache.put, text, "tts-1", tts_voice, fmt, response.content)
+    return response.content
+
+
+# Spoken answers, same NDJSON events as app.py's /stream/speech
+@app.route("/stream/speech", methods=["POST"])
+async def stream_speech():
+    session_id, user_input, tts_voice, fmt, config, error = chat.speech_options((await request.get_json()) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    async def generate():
+        events = aspeak_while_streaming(
+            answer_events(session_id, user_input, config),
+            lambda sentence: speech_audio(sentence, tts_voice, fmt),
+        )
+        try:
+            async for event in events:
+                line = chat.speech_line(event, fmt)
+                if line:
+                    yield line
+        except Exception as e:
+            log.warning("Speech stream failed: %s", e)
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        yield json.dumps({"type": "done", "session_id": session_id}) + "\n"
+
+    resp = Response(generate(), mimetype="application/x-ndjson")
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@app.route("/reset", methods=["POST"])
+async def reset():
+    session_id = (await request.get_json()).get("session_id")
+    await asyncio.to_thread(chat.chat_sessions.reset, session_id)
+    chat.history.forget(session_id)
+    chat.speculative_jobs.discard_session(session_id)
+    return jsonify({"message": "Session reset"}), 200
+
+
+# Follow-ups and classification share app.py's speculative jobs: the work usually
+# started when the answer finished, so these just await the (in-flight) result.
+@app.route("/generate-followups", methods=["POST"])
+async def generate_followups():
+    data = await request.get_json()
+    last_answer = data.get("last_answer", "")
+    if not last_answer:
+        return jsonify({"followups": []})
+    job = chat.speculative_jobs.run(
+        chat.content_key("followups", last_answer), lambda: chat.compute_followups(last_answer)
+    )
+    return jsonify({"followups": await asyncio.wrap_future(job)})
+
+
+@app.route("/classify", methods=["POST"])
+async def classify_question():
+    data = await request.get_json()
+    question, ai_response = data.get("question"), data.get("ai_response")
+    job = chat.speculative_jobs.run(
+        chat.content_key("classify", question, ai_response),
+        lambda: chat.compute_classification(question, ai_response),
+    )
+    return jsonify(await asyncio.wrap_future(job))
+
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    return jsonify(await asyncio.to_thread(chat.chat_sessions.stats))
+
+
+@app.get("/api/history/stats")
+async def history_stats():
+    return jsonify(chat.history.stats())
+
+
+@app.get("/api/context/stats")
+async def context_stats():
+    return jsonify(chat.context_assembler.stats())
+
+
+@app.get("/api/answer-cache/stats")
+async def answer_cache_stats():
+    return jsonify(chat.answer_cache.stats())
+
+
+@app.get("/api/embedding-cache/stats")
+async def embedding_cache_stats():
+    return jsonify(chat.embeddings.stats())
+
+
+@app.get("/api/local-replica/stats")
+async def local_replica_stats():
+    return jsonify(chat.replica.stats() if chat.replica else {"enabled": False})
+
+
+@app.get("/api/sse/stats")
+async def sse_stats():
+    return jsonify(sse.stats())
+
+
+@app.get("/api/tts-cache/stats")
+async def tts_cache_stats():
+    return jsonify(chat.tts_cache.stats() if chat.tts_cache else {"enabled": False})
+
+
+@app.get("/api/card-router/stats")
+async def card_router_stats():
+    return jsonify(chat.card_router.stats())
+
+
+@app.get("/api/speculative/stats")
+async def speculative_stats():
+    return jsonify(chat.speculative_jobs.stats())
+
+
+@app.get("/api/http-pool/stats")
+async def http_pool_stats():
+    # app.py and voice.py share one process-wide client
+    return jsonify(chat.http_client.stats())
+
+
+@app.get("/api/sparse-index/stats")
+async def sparse_index_stats():
+    return jsonify({"chat": chat.sparse_index.stats(), "search": voice.sparse_index.stats()})
+
+
+@app.get("/api/payload-indexes/stats")
+async def payload_indexes_stats():
+    return jsonify(voice.payload_indexes.stats())
+
+
+# === Realtime (WebRTC) ===
+@app.post("/api/rtc-transcribe-connect")
+async def rtc_transcribe_connect():
+    """Async version of app.rtc_transcribe_connect (same steps, same responses)."""
+    offer_sdp = await request.get_data()
+    if not offer_sdp:
+        return Response(b"No SDP provided", status=400, mimetype="text/plain")
+
+    # Sessions come from app.py's pre-warmed pool; an empty pool creates one inline (in a thread)
+    try:
+        with stage("session"):
+            client_secret = await asyncio.to_thread(chat.transcription_pool.acquire)
+    except RealtimeSessionError as e:
+        log.error("Failed to create transcription session: %s", e)
+        return Response(e.body or str(e).encode(), status=e.status, mimetype="text/plain")
+
+    sdp_headers = {
+        "Authorization": f"Bearer {client_secret}",
+        "Content-Type": "application/sdp",
+        "OpenAI-Beta": "realtime=v1",
+        "Cache-Control": "no-cache",
+    }
+    try:
+        with stage("sdp_exchange"):
+            ans = await http.post(
+                f"{chat.OAI_BASE}/realtime",
+                params={"intent": "transcription"},
+                headers=sdp_headers,
+                content=offer_sdp,
+                timeout=30,
+            )
+    except Exception as e:
+        upstream_error("sdp_exchange")
+        log.exception("SDP exchange error")
+        return Response(f"SDP exchange error: {e}".encode(), status=502, mimetype="text/plain")
+
+    if not ans.is_success:
+        upstream_error("sdp_exchange")
+        log.error("SDP exchange failed (%s): %s", ans.status_code, ans.text)
+        return Response(ans.content or b"SDP exchange failed",
+                        status=ans.status_code,
+                        mimetype=ans.headers.get("Content-Type", "text/plain"))
+
+    answer_bytes = ans.content or b""
+    if not answer_bytes.startswith(b"v="):
+        log.error("Upstream returned non-SDP body (first bytes): %r", answer_bytes[:2000])
+        return Response(answer_bytes, status=502, mimetype="text/plain")
+
+    resp = Response(answer_bytes, status=200, mimetype="application/sdp")
+    resp.headers["Content-Disposition"] = "inline; filename=answer.sdp"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@app.route("/api/rtc-connect", methods=["POST"])
+async def connect_rtc():
+    """Async version of voice.connect_rtc."""
+    try:
+        client_sdp = await request.get_data(as_text=True)
+        if not client_sdp:
+            return Response("No SDP provided", status=400, mimetype="text/plain")
+
+        try:
+            with stage("session"):
+                ephemeral_token = await asyncio.to_thread(voice.realtime_pool.acquire)
+        except RealtimeSessionError as e:
+            log.error("Session create failed: %s", e)
+            return Response("Failed to create realtime session", status=500, mimetype="text/plain")
+
+        with stage("sdp_exchange"):
+            sdp_resp = await http.post(
+                voice.OPENAI_API_URL,
+                headers={
+                    "Authorization": f"Bearer {ephemeral_token}",
+                    "Content-Type": "application/sdp",
+                },
+                params={"model": voice.MODEL_ID, "voice": voice.VOICE},
+                content=client_sdp,
+                timeout=60,
+            )
+        if not sdp_resp.is_success:
+            upstream_error("sdp_exchange")
+            log.error("SDP exchange failed: %s %s", sdp_resp.status_code, sdp_resp.text)
+            return Response("SDP exchange error", status=500, mimetype="text/plain")
+
+        return Response(sdp_resp.content, status=200, mimetype="application/sdp")
+
+    except Exception as e:
+        log.exception("RTC connection error")
+        return Response(f"Error: {e}", status=500, mimetype="text/plain")
+
+
+@app.get("/api/realtime-pool/stats")
+async def realtime_pool_stats():
+    return jsonify({"transcription": chat.transcription_pool.stats(), "realtime": voice.realtime_pool.stats()})
+
+
+@app.route("/api/session-context", methods=["POST", "OPTIONS"])
+async def api_session_context():
+    data = await request.get_json(silent=True) or {}
+    log.info("[session-context] session_id=%s chars=%d",
+             (data.get("session_id") or "").strip(), len((data.get("transcript") or "").strip()))
+    return jsonify({"ok": True}), 200
+
+
+def _point_result(point, fields=None):
+    payload = point.payload or {}
+    metadata = payload.get("metadata") or {}
+    hit = {"content": payload.get("page_content")} if fields is None or "content" in fields else {}
+    hit["metadata"] = metadata if fields is None else {key: metadata[key] for key in fields if key in metadata}
+    hit["relevance_score"] = float(point.score)
+    return hit
+
+
+@app.route("/api/search", methods=["POST"])
+async def search():
+    try:
+        params, error = voice.parse_search(await request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
+        mode = params["mode"] or voice.search_retriever.mode
+        mmr = voice.search_retriever.mmr if params["mmr"] is None else params["mmr"]
+        if mode != "dense" or mmr or voice.search_retriever.uses_replica():
+            # BM25 ranking, MMR re-ranking and replica searches are local CPU work;
+            # run voice.py's retriever off the event loop
+            results = await asyncio.to_thread(voice.search_retriever.search, **params)
+            return jsonify({"results": voice.format_results(results, params["fields"])})
+
+        vector = await chat.embeddings.aembed_query(params["query"])
+        voice.payload_indexes.ensure(params["filter"])
+        with stage("qdrant"):
+            response = await qdrant.query_points(
+                collection_name=os.getenv("QDRANT_COLLECTION_NAME"),
+                query=vector,
+                query_filter=metadata_filter(params["filter"]),
+                limit=params["k"],
+                score_threshold=params["score_threshold"],
+                with_payload=payload_selector(params["fields"]),
+            )
+        return jsonify({"results": [_point_result(point, params["fields"]) for point in response.points]})
+
+    except Exception as e:
+        log.error("Search error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/search/batch", methods=["POST"])
+async def search_batch():
+    """Async version of voice.search_batch: one embeddings call, one Qdrant batch query."""
+    data = (await request.get_json(silent=True)) or {}
+    queries, error = voice.parse_search_batch(data)
+    if error:
+        return jsonify({"error": error}), 400
+    mode = data.get("mode") or voice.search_retriever.mode
+    mmr = voice.search_retriever.mmr if data.get("mmr") is None else data["mmr"]
+    try:
+        if mode != "dense" or mmr or voice.search_retriever.uses_replica():
+            batches = await asyncio.to_thread(voice.search_retriever.search_batch, queries, mode, mmr)
+            return jsonify({
+                "results": [
+                    {"query": query, "results": voice.format_results(results)}
+                    for (query, _, _), results in zip(queries, batches)
+                ]
+            })
+        vectors = await chat.embeddings.aembed_documents([query for query, _, _ in queries])
+        requests = [
+            models.QueryRequest(query=vector, limit=k, filter=metadata_filter(filter), with_payload=True)
+            for vector, (_, k, filter) in zip(vectors, queries)
+        ]
+        with stage("qdrant"):
+            responses = await qdrant.query_batch_points(
+                collection_name=os.getenv("QDRANT_COLLECTION_NAME"), requests=requests
+            )
+        return jsonify({
+            "results": [
+                {"query": query, "results": [_point_result(point) for point in response.points]}
+                for (query, _, _), response in zip(queries, responses)
+            ]
+        })
+
+    except Exception as e:
+        log.error("Batch search error: %s", e)
+        return jsonify({"error": str(e)}), 500
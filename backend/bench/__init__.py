@@ -0,0 +1 @@
+"""Offline load tests: local OpenAI / Qdrant fakes (fakes.py) and the driver (run.py)."""
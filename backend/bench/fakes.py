@@ -0,0 +1,340 @@
+"""
+Local stand-ins for the upstreams the backend talks to, for load tests that cost nothing.
+
+    FakeOpenAI   /v1/chat/completions (streamed or not), /v1/embeddings, /v1/audio/speech, /v1/models,
+                 /v1/realtime/sessions, /v1/realtime/transcription_sessions, /v1/realtime (SDP)
+    FakeQdrant   the REST endpoints qdrant-client uses for one collection (query, batch query,
+                 search, scroll, retrieve, payload index), backed by an
+                 in-memory qdrant_client.QdrantClient(":memory:")
+
+Latency and token rate come from FakeConfig. Embeddings are deterministic per input, so the
+seeded collection and the backend's queries live in the same vector space.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from qdrant_client import QdrantClient, models
+from werkzeug.serving import make_server
+
+ANSWER_WORDS = (
+    "Doctor AI helps clinicians review symptoms, draft notes and check guidelines "
+    "directly from the platform dashboard while keeping the patient record in view"
+).split()
+
+SDP_ANSWER = (
+    "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+    "m=audio 9 UDP/TLS/RTP/SAVPF 111\r\nc=IN IP4 0.0.0.0\r\na=rtpmap:111 opus/48000/2\r\n"
+)
+
+
+class FakeConfig:
+    def __init__(self, latency_ms=50, ttft_ms=300, tokens_per_sec=60, answer_tokens=120,
+                 embedding_dim=1536, tts_bytes=32000, tts_bytes_per_sec=64000, documents=200):
+        self.latency = latency_ms / 1000       # fixed cost of every non-streamed call
+        self.ttft = ttft_ms / 1000             # delay before the first streamed token
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+        self.embedding_dim = embedding_dim
+        self.tts_bytes = tts_bytes
+        self.tts_bytes_per_sec = tts_bytes_per_sec
+        self.documents = documents
+
+    def as_dict(self):
+        return {
+            "latency_ms": self.latency * 1000,
+            "ttft_ms": self.ttft * 1000,
+            "tokens_per_sec": self.tokens_per_sec,
+            "answer_tokens": self.answer_tokens,
+            "embedding_dim": self.embedding_dim,
+            "tts_bytes": self.tts_bytes,
+            "tts_bytes_per_sec": self.tts_bytes_per_sec,
+            "documents": self.documents,
+        }
+
+
+def fake_embedding(item, dim):
+    """Unit vector derived from the input (a string or a list of token ids)."""
+    raw = item if isinstance(item, str) else json.dumps(item)
+    seed = int.from_bytes(hashlib.sha256(raw.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_reply(messages, answer_tokens):
+    """Canned completion shaped like what each backend prompt expects."""
+    text = " ".join(str(m.get("content", "")) for m in messages)
+    if "routing assistant" in text:
+        return "3"
+    if "follow-up questions" in text:
+        return json.dumps(["What does Doctor AI cost?", "Can I try the demo?", "Is my data stored?"])
+    if "generate a search query" in text:
+        return "Doctor AI features"
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(answer_tokens)]
+    return " ".join(words) + "."
+
+
+def _chunks(text):
+    words = text.split(" ")
+    return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+
+class FakeOpenAI:
+    def __init__(self, config):
+        self.config = config
+        self.app = Flask("fake-openai")
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._routes()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _routes(self):
+        app, cfg = self.app, self.config
+
+        @app.post("/v1/chat/completions")
+        def chat_completions():
+            self._count("chat")
+            body = request.get_json()
+            reply = fake_reply(body.get("messages", []), cfg.answer_tokens)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            model = body.get("model", "gpt-4o")
+
+            if not body.get("stream"):
+                time.sleep(cfg.ttft + len(reply.split()) / cfg.tokens_per_sec)
+                return jsonify({
+                    "id": completion_id, "object": "chat.completion", "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": reply}}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": len(reply.split()),
+                              "total_tokens": 100 + len(reply.split())},
+                })
+
+            def chunk(delta, finish=None):
+                return "data: " + json.dumps({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }) + "\n\n"
+
+            def generate():
+                time.sleep(cfg.ttft)
+                yield chunk({"role": "assistant", "content": ""})
+                for token in _chunks(reply):
+                    yield chunk({"content": token})
+                    time.sleep(1 / cfg.tokens_per_sec)
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return Response(generate(), mimetype="text/event-stream")
+
+        @app.get("/v1/models")
+        def list_models():
+            return jsonify({"object": "list", "data": [
+                {"id": m, "object": "model", "created": 0, "owned_by": "fake"}
+                for m in ("gpt-4o", "text-embedding-ada-002", "tts-1")
+            ]})
+
+        @app.post("/v1/embeddings")
+        def embeddings():
+            self._count("embeddings")
+            body = request.get_json()
+            inputs = body["input"]
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            time.sleep(cfg.latency)
+            data = []
+            for i, item in enumerate(inputs):
+                vector = fake_embedding(item, body.get("dimensions") or cfg.embedding_dim)
+                if body.get("encoding_format") == "base64":
+                    encoded = base64.b64encode(vector.tobytes()).decode("ascii")
+                else:
+                    encoded = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": encoded})
+            return jsonify({"object": "list", "data": data, "model": body.get("model"),
+                            "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)}})
+
+        @app.post("/v1/audio/speech")
+        def speech():
+            self._count("speech")
+            fmt = (request.get_json() or {}).get("response_format", "mp3")
+            chunk_size = 4096
+            delay = chunk_size / cfg.tts_bytes_per_sec
+
+            def generate():
+                time.sleep(cfg.latency)
+                sent = 0
+                while sent < cfg.tts_bytes:
+                    size = min(chunk_size, cfg.tts_bytes - sent)
+                    yield b"\0" * size
+                    sent += size
+                    time.sleep(delay)
+
+            mimetype = {"opus": "audio/ogg", "aac": "audio/aac"}.get(fmt, "audio/mpeg")
+            return Response(generate(), mimetype=mimetype)
+
+        @app.post("/v1/realtime/sessions")
+        @app.post("/v1/realtime/transcription_sessions")
+        def realtime_session():
+            self._count("realtime_session")
+            time.sleep(cfg.latency)
+            return jsonify({
+                "id": f"sess_{uuid.uuid4().hex[:12]}",
+                "client_secret": {"value": f"ek_{uuid.uuid4().hex}", "expires_at": int(time.time()) + 60},
+            })
+
+        @app.post("/v1/realtime")
+        def realtime_sdp():
+            self._count("sdp")
+            time.sleep(cfg.latency)
+            return Response(SDP_ANSWER, mimetype="application/sdp", status=201)
+
+
+class FakeQdrant:
+    """One collection served over the Qdrant REST API (the subset qdrant-client calls)."""
+
+    def __init__(self, config, collection="bench"):
+        self.config = config
+        self.collection = collection
+        self.client = QdrantClient(":memory:")
+        self.app = Flask("fake-qdrant")
+        self._lock = threading.Lock()  # the local client is not thread-safe
+        self._seed()
+        self._routes()
+
+    def _seed(self):
+        cfg = self.config
+        self.client.create_collection(
+            self.collection,
+            vectors_config=models.VectorParams(size=cfg.embedding_dim, distance=models.Distance.COSINE),
+        )
+        points = []
+        for i in range(cfg.documents):
+            text = f"Document {i}: " + " ".join(ANSWER_WORDS[(i + j) % len(ANSWER_WORDS)] for j in range(40))
+            points.append(models.PointStruct(
+                id=i,
+                vector=fake_embedding(text, cfg.embedding_dim).tolist(),
+                payload={"page_content": text, "metadata": {"source": f"doc-{i}", "card_id": i % 7 + 1}},
+            ))
+        self.client.upsert(self.collection, points)
+
+    @staticmethod
+    def _ok(result):
+        def dump(value):
+            return value.model_dump(mode="json", exclude_none=True) if hasattr(value, "model_dump") else value
+
+        result = [dump(r) for r in result] if isinstance(result, list) else dump(result)
+        return jsonify({"result": result, "status": "ok", "time": 0.0})
+
+    def _query(self, req):
+        return self.client.query_points(
+            self.collection,
+            query=req.query,
+            using=req.using,
+            prefetch=req.prefetch,
+            query_filter=req.filter,
+            search_params=req.params,
+            limit=req.limit or 10,
+            offset=req.offset,
+            with_payload=True if req.with_payload is None else req.with_payload,
+            with_vectors=req.with_vector or False,
+            score_threshold=req.score_threshold,
+        )
+
+    def _routes(self):
+        app = self.app
+
+        @app.get("/")
+        def root():
+            return jsonify({"title": "qdrant - fake", "version": "1.12.0"})
+
+        @app.get("/collections/<name>")
+        def collection(name):
+            with self._lock:
+                return self._ok(self.client.get_collection(name))
+
+        @app.get("/collections/<name>/exists")
+        def exists(name):
+            return self._ok({"exists": name == self.collection})
+
+        @app.post("/collections/<name>/points/query")
+        def query(name):
+            req = models.QueryRequest(**request.get_json())
+            time.sleep(self.config.latency)
+            with self._lock:
+                return self._ok(self._query(req))
+
+        @app.post("/collections/<name>/points/query/batch")
+        def query_batch(name):
+            batch = models.QueryRequestBatch(**request.get_json())
+            time.sleep(self.config.latency)
+            with self._lock:
+                return self._ok([self._query(req) for req in batch.searches])
+
+        @app.post("/collections/<name>/points/search")
+        def search(name):
+            # Older qdrant-client versions (langchain_qdrant.Qdrant) still call /points/search
+            req = models.SearchRequest(**request.get_json())
+            query = getattr(req.vector, "vector", req.vector)  # plain or NamedVector
+            time.sleep(self.config.latency)
+            with self._lock:
+                points = self.client.query_points(
+                    self.collection, query=query, query_filter=req.filter, limit=req.limit,
+                    offset=req.offset, with_payload=True if req.with_payload is None else req.with_payload,
+                    score_threshold=req.score_threshold,
+                ).points
+            return self._ok(points)
+
+        @app.put("/collections/<name>/index")
+        def create_index(name):
+            body = request.get_json()
+            with self._lock:
+                self.client.create_payload_index(self.collection, body["field_name"], body.get("field_schema"))
+            return self._ok({"operation_id": 0, "status": "acknowledged"})
+
+        @app.post("/collections/<name>/points")
+        def retrieve(name):
+            body = request.get_json() or {}
+            with self._lock:
+                points = self.client.retrieve(
+                    self.collection, ids=body["ids"], with_payload=body.get("with_payload", True),
+                    with_vectors=body.get("with_vector", False),
+                )
+            return self._ok(points)
+
+        @app.post("/collections/<name>/points/scroll")
+        def scroll(name):
+            body = request.get_json() or {}
+            with self._lock:
+                points, next_offset = self.client.scroll(
+                    self.collection, limit=body.get("limit", 10), offset=body.get("offset"),
+                    with_payload=body.get("with_payload", True), with_vectors=body.get("with_vector", False),
+                )
+            return self._ok({"points": [p.model_dump(mode="json", exclude_none=True) for p in points],
+                             "next_page_offset": next_offset})
+
+
+class ServerThread:
+    """Serves a WSGI app on 127.0.0.1 from a daemon thread (port 0 picks a free port)."""
+
+    def __init__(self, app, port=0):
+        self.server = make_server("127.0.0.1", port, app, threaded=True)
+        self.port = self.server.server_port
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
@@ -0,0 +1,335 @@
+"""
+Load test the backend against local fakes of OpenAI and Qdrant (see bench/fakes.py).
+
+    python -m bench.run                                   # flask mode (app.py + voice.py)
+    python -m bench.run --mode asgi --concurrency 1,8,32,128
+    python -m bench.run --routes stream,search --compare bench/results/baseline.json
+
+The fakes run in this process; the backend runs as child processes pointed at them through
+OPENAI_BASE_URL / QDRANT_HOST, with any other env (REWRITE_MODE, caches, ...) passed through.
+Every route is driven at each concurrency level and p50/p95/p99 latency, time to first byte
+(streamed routes) and requests/sec are written to a JSON file. --compare exits with status 1
+when p95 or throughput of any (route, concurrency) is worse than the baseline by more than
+--threshold.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from bench.fakes import FakeConfig, FakeOpenAI, FakeQdrant, SDP_ANSWER, ServerThread
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+
+QUESTIONS = [
+    "What does the AI Doctor Assistant do?",
+    "How accurate is the medical transcription app?",
+    "Can the data analyst dashboard read Excel files?",
+    "How do I enhance a medical report?",
+    "Tell me about the IVF virtual training assistant.",
+]
+
+
+def _question(i, repeat):
+    base = QUESTIONS[i % len(QUESTIONS)]
+    return base if repeat else f"{base} (#{i})"
+
+
+# name -> (server, path, streamed, request kwargs for request i); for SSE, streamed is the
+# bytes that mark the first token, so heartbeats and the sources event do not count as TTFB
+ROUTES = {
+    "stream": ("chat", "/stream", True,
+               lambda i, r: {"json": {"message": _question(i, r), "session_id": f"bench-{i}"}}),
+    "stream_sse": ("chat", "/stream", b"event: token",
+                   lambda i, r: {"json": {"message": _question(i, r), "session_id": f"bench-{i}", "format": "sse"}}),
+    "generate": ("chat", "/generate", False,
+                 lambda i, r: {"json": {"message": _question(i, r), "session_id": f"bench-{i}"}}),
+    "tts": ("chat", "/tts", False,
+            lambda i, r: {"json": {"text": _question(i, r)}}),
+    "classify": ("chat", "/classify", False,
+                 lambda i, r: {"json": {"question": _question(i, r), "ai_response": "It drafts notes."}}),
+    "search": ("voice", "/api/search", False,
+               lambda i, r: {"json": {"query": _question(i, r)}}),
+    "search_batch": ("voice", "/api/search/batch", False,
+                     lambda i, r: {"json": {"queries": [_question(i * 4 + j, r) for j in range(4)], "k": 3}}),
+    "rtc_transcribe": ("chat", "/api/rtc-transcribe-connect", False,
+                       lambda i, r: {"content": SDP_ANSWER.encode(), "headers": {"Content-Type": "application/sdp"}}),
+    "rtc_connect": ("voice", "/api/rtc-connect", False,
+                    lambda i, r: {"content": SDP_ANSWER.encode(), "headers": {"Content-Type": "application/sdp"}}),
+}
+
+
+# === BACKEND PROCESSES ===
+def _backend_env(openai_url, qdrant_url, collection, workdir):
+    env = dict(os.environ)
+    env.pop("QDRANT_API_KEY", None)
+    env.update({
+        "OPENAI_API_KEY": env.get("BENCH_OPENAI_API_KEY", "sk-bench"),
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "QDRANT_HOST": qdrant_url,
+        "QDRANT_COLLECTION_NAME": collection,
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+        "EMBEDDING_CHECK_CTX_LENGTH": "0",  # keeps tiktoken from downloading its encoding
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def _free_port():
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(mode, env, workdir, servers=("chat", "voice")):
+    """Returns ({server: url}, [Popen]) once every server answers."""
+    procs, urls = [], {}
+
+    def spawn(name, argv):
+        log_path = os.path.join(workdir, f"{name}.log")
+        procs.append(subprocess.Popen(argv, cwd=BACKEND_DIR, env=env,
+                                      stdout=open(log_path, "wb"), stderr=subprocess.STDOUT))
+        return log_path
+
+    logs = []
+    if mode == "asgi":
+        port = _free_port()
+        logs.append(spawn("asgi", [sys.executable, "-m", "uvicorn", "asgi:app",
+                                   "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]))
+        urls = {"chat": f"http://127.0.0.1:{port}", "voice": f"http://127.0.0.1:{port}"}
+    else:
+        for name, module in (("chat", "app"), ("voice", "voice")):
+            if name not in servers:
+                continue
+            port = _free_port()
+            logs.append(spawn(name, [sys.executable, "-c",
+                                     f"import {module}; {module}.app.run(host='127.0.0.1', port={port}, threaded=True)"]))
+            urls[name] = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 120
+    for url in set(urls.values()):
+        while True:
+            if any(p.poll() is not None for p in procs):
+                stop_backend(procs)
+                raise RuntimeError(f"backend exited during startup, see {', '.join(logs)}")
+            try:
+                # /api/ready turns 200 once warm-up is done, so it is not part of the measurements
+                if httpx.get(url + "/api/ready", timeout=2).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline:
+                stop_backend(procs)
+                raise RuntimeError(f"backend did not become ready, see {', '.join(logs)}")
+            time.sleep(0.5)
+    return urls, procs
+
+
+def stop_backend(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# === LOAD DRIVER ===
+async def _one(client, url, streamed, kwargs):
+    start = time.perf_counter()
+    ttfb = None
+    try:
+        if streamed:
+            marker = streamed if isinstance(streamed, bytes) else b""
+            async with client.stream("POST", url, **kwargs) as resp:
+                async for chunk in resp.aiter_bytes():
+                    if ttfb is None and chunk and marker in chunk:
+                        ttfb = time.perf_counter() - start
+                ok = resp.is_success
+        else:
+            resp = await client.post(url, **kwargs)
+            ok = resp.is_success
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - start, ttfb
+
+
+async def drive(url, streamed, make_kwargs, concurrency, total, repeat, first=0):
+    """Sends requests first..first+total-1 (plus one unmeasured warm-up) at `concurrency`."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def run(i):
+            async with semaphore:
+                return await _one(client, url, streamed, make_kwargs(i, repeat))
+
+        await _one(client, url, streamed, make_kwargs(first + total, repeat))  # warm-up, not measured
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(run(first + i) for i in range(total)))
+        wall = time.perf_counter() - start
+    return samples, wall
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "mean": round(float(ms.mean()), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+
+def summarize(route, concurrency, samples, wall, upstream_calls):
+    ok = [s for s in samples if s[0]]
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": _percentiles([s[1] for s in ok]),
+        "ttfb_ms": _percentiles([s[2] for s in ok if s[2] is not None]),
+        "upstream_calls": upstream_calls,
+    }
+
+
+# === COMPARISON ===
+def compare(results, baseline, threshold):
+    """Prints p95 / rps deltas against `baseline`; returns the regressed (route, concurrency) keys."""
+    base = {(r["route"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'route':<16}{'conc':>6}{'p95 ms':>12}{'base':>10}{'rps':>10}{'base':>10}")
+    for r in results:
+        key = (r["route"], r["concurrency"])
+        b = base.get(key)
+        if b is None or not r["latency_ms"] or not b["latency_ms"]:
+            continue
+        p95, base_p95 = r["latency_ms"]["p95"], b["latency_ms"]["p95"]
+        worse = p95 > base_p95 * (1 + threshold) or r["rps"] < b["rps"] * (1 - threshold)
+        if worse:
+            regressions.append(key)
+        print(f"{r['route']:<16}{r['concurrency']:>6}{p95:>12.1f}{base_p95:>10.1f}"
+              f"{r['rps']:>10.1f}{b['rps']:>10.1f}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against fake OpenAI / Qdrant")
+    parser.add_argument("--mode", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated subset of: " + ", ".join(ROUTES))
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per route and level")
+    parser.add_argument("--repeat", action="store_true",
+                        help="reuse the same few questions so the answer / embedding / TTS caches hit")
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake upstream latency per call")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="fake time to first chat token")
+    parser.add_argument("--tokens-per-sec", type=float, default=60)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--documents", type=int, default=200, help="points in the fake collection")
+    parser.add_argument("--output", help="results file (default: bench/results/bench-<time>.json)")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    log = logging.getLogger("bench")
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    config = FakeConfig(latency_ms=args.latency_ms, ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec,
+                        answer_tokens=args.answer_tokens, documents=args.documents)
+    openai = FakeOpenAI(config)
+    qdrant = FakeQdrant(config)
+    fake_openai = ServerThread(openai.app).start()
+    fake_qdrant = ServerThread(qdrant.app).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    env = _backend_env(fake_openai.url, fake_qdrant.url, qdrant.collection, workdir)
+    log.info("starting %s backend (logs in %s)", args.mode, workdir)
+    urls, procs = start_backend(args.mode, env, workdir, {ROUTES[r][0] for r in routes})
+
+    results = []
+    first = 0  # request numbers never repeat across levels, so only --repeat hits the caches
+    try:
+        for route in routes:
+            server, path, streamed, make_kwargs = ROUTES[route]
+            for concurrency in levels:
+                total = max(args.requests, concurrency)
+                before = dict(openai.counts)
+                samples, wall = asyncio.run(
+                    drive(urls[server] + path, streamed, make_kwargs, concurrency, total, args.repeat, first)
+                )
+                first += total + 1
+                calls = {k: v - before.get(k, 0) for k, v in openai.counts.items() if v - before.get(k, 0)}
+                row = summarize(route, concurrency, samples, wall, calls)
+                results.append(row)
+                lat = row["latency_ms"] or {}
+                log.info("%-15s c=%-4d p50=%8.1f p95=%8.1f p99=%8.1f ms  %7.1f req/s  errors=%d",
+                         route, concurrency, lat.get("p50", 0), lat.get("p95", 0), lat.get("p99", 0),
+                         row["rps"], row["errors"])
+    finally:
+        stop_backend(procs)
+        fake_openai.stop()
+        fake_qdrant.stop()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "mode": args.mode,
+            "requests_per_level": args.requests,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "fake": config.as_dict(),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fp:
+        json.dump(report, fp, indent=2)
+    log.info("results written to %s", output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
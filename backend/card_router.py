@@ -0,0 +1,148 @@
+import threading
+
+import numpy as np
+
+# Card IDs used by the frontend (see /classify). Each card is described by a short
+# description plus example questions; their embeddings form the card's centroid.
+CARDS = {
+    1: {
+        "name": "AI Doctor Assistant",
+        "texts": [
+            "AI Doctor Assistant: record the case, analyze the consultation and get a structured clinical note "
+            "with differential diagnoses, investigations, prescriptions and a treatment plan.",
+            "How do I ask the Doctor AI a medical question?",
+            "How do I record a case and press Analyze?",
+            "Can the doctor assistant suggest a treatment plan?",
+            "How do I talk to the AI doctor with the microphone?",
+        ],
+    },
+    2: {
+        "name": "Medical Transcription App",
+        "texts": [
+            "Medical Transcription App: record the consultation and the AI fills chief complaint, present illness, "
+            "medication and plan fields, with a claim review card with ICD-10 codes.",
+            "How do I start and stop recording in the transcription app?",
+            "Where do I see the ICD-10 codes and claim review card?",
+            "How does transcription fill the HIS fields?",
+            "Can I transcribe my consultation automatically?",
+        ],
+    },
+    3: {
+        "name": "Data Analyst Dashboard",
+        "texts": [
+            "Data Analyst Dashboard: upload data, ask questions about it and get charts, KPIs and statistics "
+            "from an AI data analyst.",
+            "How do I upload a spreadsheet to the data analyst?",
+            "Can the dashboard generate charts from hospital data?",
+            "How do I analyze statistics and KPIs with AI?",
+        ],
+    },
+    4: {
+        "name": "Medical Report Enhancement Tool",
+        "texts": [
+            "Medical Report Enhancement Platform: generate reports from templates, dictate fields, enhance grammar "
+            "and clarity, upload PDF reports, translate and send reports by WhatsApp or email.",
+            "How do I enhance a medical report with AI?",
+            "How do I generate a report from a template?",
+            "Can I upload a PDF report and translate it?",
+            "How do I send the report by WhatsApp or email?",
+        ],
+    },
+    5: {
+        "name": "IVF Virtual Training Assistant",
+        "texts": [
+            "IVF Virtual Training Assistant: training for IVF and fertility procedures with an AI tutor, "
+            "lessons and quizzes for embryology and reproductive medicine.",
+            "How do I use the IVF training assistant?",
+            "Is there training for IVF procedures?",
+            "Can the IVF assistant quiz me on embryology?",
+        ],
+    },
+    6: {
+        "name": "Patient Navigation Assistant",
+        "texts": [
+            "Patient Navigation Assistant: an avatar that helps patients find departments, book appointments "
+            "and navigate the hospital.",
+            "How can a patient find a department in the hospital?",
+            "How do patients book an appointment with the assistant?",
+            "Where is the patient avatar that guides visitors?",
+        ],
+    },
+    7: {
+        "name": "AI Meeting Assistant",
+        "texts": [
+            "AI Meeting Assistant: records meetings, transcribes them and produces minutes, summaries "
+            "and action items.",
+            "How do I record a meeting and get the minutes?",
+            "Can the AI summarize a meeting and list action items?",
+            "How do I use the meeting assistant?",
+        ],
+    },
+}
+
+
+class CardRouter:
+    """
+    Routes a question/answer pair to a card ID by nearest centroid over embeddings.
+
+    Centroids are built once (lazily) from each card's texts. A request is scored with a
+    single matrix-vector product; it is accepted locally when the best cosine similarity
+    reaches min_score and beats the runner-up by min_margin, otherwise the caller's
+    fallback (the LLM classifier) decides.
+    """
+
+    def __init__(self, embeddings, cards=CARDS, min_score=0.75, min_margin=0.02):
+        self.embeddings = embeddings
+        self.cards = cards
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self._ids = None
+        self._centroids = None
+        self._lock = threading.Lock()
+        self._counts = {"local": 0, "fallback": 0}
+
+    def _build(self):
+        with self._lock:
+            if self._centroids is not None:
+                return
+            ids, rows = [], []
+            for card_id, card in self.cards.items():
+                vectors = np.asarray(self.embeddings.embed_documents(card["texts"]), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                centroid = vectors.mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+                ids.append(card_id)
+            self._ids = np.asarray(ids)
+            self._centroids = np.stack(rows)
+
+    def scores(self, text):
+        """Cosine similarity of `text` to every card centroid, as {card_id: score}."""
+        self._build()
+        query = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        sims = self._centroids @ (query / np.linalg.norm(query))
+        return dict(zip(self._ids.tolist(), sims.tolist()))
+
+    def route(self, question, ai_response=""):
+        """Returns (card_id or None, best score, margin over the runner-up)."""
+        text = f"{question or ''}\n{(ai_response or '')[:1000]}".strip()
+        if not text:
+            return None, 0.0, 0.0
+        scores = self.scores(text)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best_id, best), (_, second) = ranked[0], ranked[1]
+        margin = best - second
+        confident = best >= self.min_score and margin >= self.min_margin
+        with self._lock:
+            self._counts["local" if confident else "fallback"] += 1
+        return (best_id if confident else None), best, margin
+
+    def classify(self, question, ai_response, fallback):
+        """Route locally, calling fallback() only when the local router is not confident."""
+        card_id, score, _ = self.route(question, ai_response)
+        if card_id is not None:
+            return {"card_id": card_id, "routed_by": "local", "score": round(score, 4)}
+        return {"card_id": fallback(), "routed_by": "llm", "score": round(score, 4)}
+
+    def stats(self):
+        with self._lock:
+            return {"min_score": self.min_score, "min_margin": self.min_margin, **self._counts}
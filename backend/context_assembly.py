@@ -0,0 +1,192 @@
+"""
+Context assembly between the retriever and create_stuff_documents_chain.
+
+The stuff chain pastes every retrieved chunk into {context} as is, so a few large chunks can
+dominate the prompt and the time to first token. ContextAssembler runs on the retrieved
+Documents, in order:
+
+  1. order by relevance (the retriever's `relevance_score`, best first)
+  2. adaptive cut: drop chunks under CONTEXT_MIN_SCORE, and everything after a drop of more
+     than CONTEXT_SCORE_GAP (relative to the best score) between neighbours
+  3. boilerplate: page numbers and copyright / confidentiality lines at the top or bottom of
+     a chunk, and lines of at least MIN_DEDUP_CHARS that an earlier chunk already contributed
+     (chunk overlap, repeated running headers), are removed; short lines ("10 mg",
+     "Adults:") and repeats inside a chunk stay, their meaning depends on where they are
+  4. token budget: chunks are added until CONTEXT_TOKENS is reached; the chunk that crosses
+     it is truncated when a useful part fits, otherwise dropped (the best chunk is always sent)
+
+    CONTEXT_ASSEMBLY=0    pass the retrieved chunks through untouched
+    CONTEXT_TOKENS        token budget for {context} (default 3000)
+    CONTEXT_SCORE_GAP     relative score drop that ends the context (default 0.35, 0 = off)
+    CONTEXT_MIN_SCORE     absolute score floor (default unset; scores are mode-specific)
+
+Relative gaps work for any retrieval mode (cosine, BM25 or fused scores); an absolute floor
+only makes sense for the mode it was tuned on. Token counts before and after assembly are
+attached to the request (metrics.annotate) and aggregated in stats().
+"""
+import logging
+import os
+import re
+import threading
+
+from langchain_core.documents import Document
+
+from history_compaction import TokenCounter
+from metrics import annotate, registry
+
+log = logging.getLogger("context")
+
+# Header / footer patterns, only stripped from the top and bottom of a chunk
+_BOILERPLATE = [
+    re.compile(r"^\s*(page\s*)?\d+\s*(of|/)\s*\d+\s*$", re.I),  # "Page 3 of 10", "3/10"
+    re.compile(r"^\s*(page|p\.)\s*\d+\s*$", re.I),
+    re.compile(r"^\s*(©|\(c\)|copyright\b).*$", re.I),
+    re.compile(r"^\s*(all rights reserved|confidential|for internal use only)\b.*$", re.I),
+    re.compile(r"^\W*$"),  # separators made of punctuation only
+]
+# A bare number is only a page number as the outermost line ("12", "- 4 -"); further in it
+# is more likely a dose or a table cell
+_PAGE_NUMBER = re.compile(r"^\s*[-–—]?\s*\d{1,4}\s*[-–—]?\s*$")
+MIN_DEDUP_CHARS = 40  # shorter repeated lines are doses, labels, table cells: always kept
+MIN_TRUNCATED_TOKENS = 64  # a truncated tail shorter than this is not worth sending
+
+
+def _normalize(line):
+    return " ".join(line.split()).lower()
+
+
+class ContextAssembler:
+    def __init__(self, budget_tokens=3000, score_gap=0.35, min_score=None, counter=None, enabled=True):
+        self.budget_tokens = budget_tokens
+        self.score_gap = score_gap
+        self.min_score = min_score
+        self.counter = counter or TokenCounter()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._totals = {
+            "requests": 0, "docs_in": 0, "docs_out": 0, "tokens_in": 0, "tokens_out": 0,
+            "cut_by_score": 0, "cut_by_budget": 0, "truncated": 0, "boilerplate_lines": 0,
+        }
+
+    def _cut(self, docs):
+        scores = [doc.metadata.get("relevance_score") for doc in docs]
+        if not docs or any(score is None for score in scores):
+            return docs
+        keep = [docs[0]]
+        top = scores[0]
+        for i in range(1, len(docs)):
+            if self.min_score is not None and scores[i] < self.min_score:
+                break
+            if self.score_gap and top > 0 and (scores[i - 1] - scores[i]) / top > self.score_gap:
+                break
+            keep.append(docs[i])
+        return keep
+
+    @staticmethod
+    def _trim_edges(lines):
+        """Drops header / footer boilerplate lines from both ends of a chunk."""
+        start, end = 0, len(lines)
+        while start < end and not lines[start].strip():
+            start += 1
+        while end > start and not lines[end - 1].strip():
+            end -= 1
+        if start < end and _PAGE_NUMBER.match(lines[start]):
+            start += 1
+        if end > start and _PAGE_NUMBER.match(lines[end - 1]):
+            end -= 1
+        while start < end and (not lines[start].strip() or any(p.match(lines[start]) for p in _BOILERPLATE)):
+            start += 1
+        while end > start and (not lines[end - 1].strip() or any(p.match(lines[end - 1]) for p in _BOILERPLATE)):
+            end -= 1
+        removed = sum(1 for line in lines[:start] + lines[end:] if line.strip())
+        return lines[start:end], removed
+
+    def _strip(self, docs):
+        seen, removed, cleaned = set(), 0, []
+        for doc in docs:
+            body, trimmed = self._trim_edges(doc.page_content.splitlines())
+            removed += trimmed
+            lines, keys = [], set()
+            for line in body:
+                key = _normalize(line)
+                # Only long lines that an earlier chunk already sent count as duplicates
+                if key in seen:
+                    removed += 1
+                    continue
+                if len(key) >= MIN_DEDUP_CHARS:
+                    keys.add(key)
+                lines.append(line.rstrip())
+            seen |= keys
+            text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+            if text:
+                cleaned.append(Document(page_content=text, metadata=doc.metadata))
+        return cleaned, removed
+
+    def _fit(self, docs):
+        fitted, used, truncated = [], 0, 0
+        for doc in docs:
+            cost = self.counter.count(doc.page_content)
+            left = self.budget_tokens - used
+            if cost <= left:
+                fitted.append(doc)
+                used += cost
+                continue
+            # The best chunk is always sent, truncated if it alone exceeds the budget
+            if left >= MIN_TRUNCATED_TOKENS or not fitted:
+                text = self.counter.truncate(doc.page_content, left)
+                fitted.append(Document(page_content=text, metadata=doc.metadata))
+                used += self.counter.count(text)
+                truncated += 1
+            break
+        return fitted, used, truncated
+
+    def assemble(self, docs):
+        """Retrieved Documents -> the Documents to stuff into the prompt."""
+        if not self.enabled or not docs:
+            return docs
+        tokens_in = sum(self.counter.count(doc.page_content) for doc in docs)
+        ordered = sorted(docs, key=lambda d: -(d.metadata.get("relevance_score") or 0.0))
+        kept = self._cut(ordered)
+        cleaned, boilerplate = self._strip(kept)
+        fitted, tokens_out, truncated = self._fit(cleaned)
+
+        report = {
+            "docs_in": len(docs), "docs_out": len(fitted),
+            "tokens_in": tokens_in, "tokens_out": tokens_out,
+            "cut_by_score": len(ordered) - len(kept),
+            "cut_by_budget": len(cleaned) - len(fitted),
+            "truncated": truncated, "boilerplate_lines": boilerplate,
+        }
+        annotate("context", report)
+        registry.inc("context_tokens_total", tokens_in, phase="retrieved")
+        registry.inc("context_tokens_total", tokens_out, phase="sent")
+        with self._lock:
+            self._totals["requests"] += 1
+            for key, value in report.items():
+                self._totals[key] += value
+        log.info("Context: %d docs / %d tokens retrieved -> %d docs / %d tokens sent",
+                 len(docs), tokens_in, len(fitted), tokens_out)
+        return fitted
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+        return {
+            "enabled": self.enabled,
+            "budget_tokens": self.budget_tokens,
+            "score_gap": self.score_gap,
+            "min_score": self.min_score,
+            "exact_token_counts": self.counter.exact,
+            **totals,
+        }
+
+
+def create_context_assembler(counter=None):
+    min_score = os.getenv("CONTEXT_MIN_SCORE")
+    return ContextAssembler(
+        budget_tokens=int(os.getenv("CONTEXT_TOKENS", "3000")),
+        score_gap=float(os.getenv("CONTEXT_SCORE_GAP", "0.35")),
+        min_score=float(min_score) if min_score else None,
+        counter=counter,
+        enabled=os.getenv("CONTEXT_ASSEMBLY", "1") == "1",
+    )
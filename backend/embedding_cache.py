@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import stage
+from warmup import Lazy
+
+# OpenAIEmbeddings' default model, which the Qdrant collection was built with
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def normalize(text):
+    return " ".join((text or "").split()).lower()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that remembers vectors for texts it has already embedded.
+
+    Lookups go to an in-memory LRU first, then (if `path` is set) to a SQLite file
+    shared across processes and restarts. Keys are (model, normalized text), so
+    "How do I open Doctor AI?" and "how do i open  doctor ai?" share one vector.
+    """
+
+    def __init__(self, inner, max_entries=4096, path=None, model=None):
+        self.inner = inner
+        self.model = model or getattr(inner, "model", type(inner).__name__)
+        self.max_entries = max_entries
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        if path:
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "  model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+                "  PRIMARY KEY (model, text))"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return vector
+        if self.path:
+            row = self._conn().execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text = ?",
+                (self.model, key),
+            ).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self._disk_hits += 1
+                return vector
+        return None
+
+    def _save(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        if self.path:
+            self._conn().executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                [(self.model, key, np.asarray(v, dtype=np.float32).tobytes())
+                 for key, v in zip(keys, vectors)],
+            )
+
+    def embed_documents(self, texts):
+        keys = [normalize(t) for t in texts]
+        vectors = [self._lookup(k) for k in keys]
+        missing = {}  # normalized key -> original text, embedded once per batch
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            with self._lock:
+                self._misses += len(missing)
+            with stage("embedding"):
+                fresh = dict(zip(missing, self.inner.embed_documents(list(missing.values()))))
+            self._save(list(fresh), list(fresh.values()))
+            vectors = [v if v is not None else fresh[k] for k, v in zip(keys, vectors)]
+        return vectors
+
+    def embed_query(self, text):
+        key = normalize(text)
+        vector = self._lookup(key)
+        if vector is None:
+            with self._lock:
+                self._misses += 1
+            with stage("embedding"):
+                vector = self.inner.embed_query(text)
+            self._save([key], [vector])
+        return vector
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "persistent": bool(self.path),
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def _openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        model=OPENAI_EMBEDDING_MODEL,
+        # EMBEDDING_CHECK_CTX_LENGTH=0 sends raw text instead of tiktoken ids (no encoding download)
+        check_embedding_ctx_length=os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "1") == "1",
+    )
+
+
+def get_embeddings():
+    """Process-wide cached OpenAIEmbeddings (EMBEDDING_CACHE_PATH enables the disk tier)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            # langchain_openai is imported on the first cache miss, not at startup
+            _shared = CachedEmbeddings(
+                Lazy(_openai_embeddings),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX", "4096")),
+                path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+                model=OPENAI_EMBEDDING_MODEL,
+            )
+        return _shared
@@ -0,0 +1,219 @@
+"""
+Token-budgeted chat history for the RAG chain.
+
+Sending the whole history window twice per turn (rewrite prompt + answer prompt) makes long
+sessions slower and dearer with every message. HistoryCompactor keeps the most recent turns
+verbatim, as many as fit in CHAT_HISTORY_TOKENS (at most CHAT_HISTORY_TURNS), and folds the
+older ones into a rolling per-session summary. Summaries are written in the background by
+the `summarize(previous_summary, messages)` callable and never block a request: a turn that
+has just been folded is covered by the next request's summary instead.
+
+    CHAT_HISTORY_COMPACTION=0   send the plain window (the previous behaviour)
+    CHAT_HISTORY_TOKENS         token budget for summary + verbatim turns (default 2000)
+    CHAT_HISTORY_TURNS          most recent turns kept verbatim (default 6)
+
+Tokens are counted with tiktoken; without its encoding files (offline hosts) a ~4 chars per
+token estimate is used. Summaries live in this process only: with several workers sharing a
+SQLite history, each worker summarizes the sessions it serves.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("history")
+
+MESSAGE_OVERHEAD = 4  # role and separators per chat message
+
+
+class TokenCounter:
+    """tiktoken counts for `model`, memoized per text (the same messages are re-sent every turn)."""
+
+    def __init__(self, model="gpt-4o", max_entries=4096):
+        self.model = model
+        self.max_entries = max_entries
+        self._encoding = None
+        self._fallback = False
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._encoding is None and not self._fallback:
+                try:
+                    import tiktoken
+
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except Exception as e:
+                    log.warning("tiktoken encoding unavailable (%s), estimating tokens from length", e)
+                    self._fallback = True
+
+    def count(self, text):
+        text = text or ""
+        with self._lock:
+            cached = self._counts.get(text)
+            if cached is not None:
+                self._counts.move_to_end(text)
+                return cached
+        if self._encoding is None and not self._fallback:
+            self._load()
+        if self._encoding is not None:
+            count = len(self._encoding.encode(text, disallowed_special=()))
+        else:
+            count = len(text) // 4 + 1
+        with self._lock:
+            self._counts[text] = count
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def truncate(self, text, max_tokens):
+        """The longest prefix of `text` that is at most `max_tokens` tokens."""
+        text = text or ""
+        if self._encoding is None and not self._fallback:
+            self._load()
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+        return text[:max(max_tokens - 1, 0) * 4]
+
+    def messages(self, messages):
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+    @property
+    def exact(self):
+        return self._encoding is not None
+
+
+def _turn_key(turn):
+    raw = "\x00".join(f"{m['role']}:{m['content']}" for m in turn)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _turns(messages):
+    # History is stored as user/assistant pairs; an odd head (cut by the window) is its own turn
+    start = len(messages) % 2
+    head = [messages[:start]] if start else []
+    return head + [messages[i:i + 2] for i in range(start, len(messages), 2)]
+
+
+class HistoryCompactor:
+    def __init__(self, store, summarize, budget_tokens=2000, keep_turns=6, window=None,
+                 max_sessions=1000, counter=None, enabled=True):
+        self.store = store
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens
+        self.keep_turns = keep_turns
+        self.window = window
+        self.max_sessions = max_sessions
+        self.counter = counter or TokenCounter()
+        self.enabled = enabled
+        self._summaries = OrderedDict()  # session_id -> (summary text, key of the last folded turn)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        self._requests = 0
+        self._tokens_sent = 0
+        self._tokens_window = 0
+        self._summaries_written = 0
+        self._failures = 0
+
+    def get(self, session_id):
+        """Chat history to send with this turn: [summary message] + the recent turns."""
+        messages = self.store.get(session_id, limit=self.window)
+        if not self.enabled or not messages:
+            return messages
+
+        with self._lock:
+            entry = self._summaries.get(session_id)
+            if entry is not None:
+                self._summaries.move_to_end(session_id)
+        summary = [{"role": "system", "content": f"Summary of the earlier conversation:\n{entry[0]}"}] \
+            if entry and entry[0] else []
+        budget = self.budget_tokens - self.counter.messages(summary)
+
+        turns = _turns(messages)
+        kept, tokens = [], 0
+        for turn in reversed(turns):
+            cost = self.counter.messages(turn)
+            # The latest turn is always kept; older ones while they fit
+            if kept and (len(kept) >= self.keep_turns or tokens + cost > budget):
+                break
+            kept.insert(0, turn)
+            tokens += cost
+        if len(kept) < len(turns):
+            self._schedule(session_id, turns, len(turns) - len(kept), entry)
+
+        history = summary + [m for turn in kept for m in turn]
+        with self._lock:
+            self._requests += 1
+            self._tokens_sent += self.counter.messages(history)
+            self._tokens_window += self.counter.messages(messages)
+        return history
+
+    def _schedule(self, session_id, turns, folded, entry):
+        """Summarizes turns[:folded] that the session's summary does not cover yet."""
+        previous, boundary = entry if entry else ("", None)
+        keys = [_turn_key(turn) for turn in turns]
+        # Turns after the last one already in the summary; if that turn has left the window
+        # since, every folded turn is newer than it
+        start = keys.index(boundary) + 1 if boundary in keys else 0
+        new = turns[start:folded]
+        if not new:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        messages = [m for turn in new for m in turn]
+        self._executor.submit(self._summarize, session_id, previous, messages, keys[folded - 1])
+
+    def _summarize(self, session_id, previous, messages, boundary):
+        try:
+            summary = self.summarize(previous, messages)
+        except Exception as e:
+            log.warning("History summary for %s failed: %s", session_id, e)
+            with self._lock:
+                self._pending.discard(session_id)
+                self._failures += 1
+            return
+        with self._lock:
+            self._pending.discard(session_id)
+            self._summaries[session_id] = (summary, boundary)
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+            self._summaries_written += 1
+
+    def forget(self, session_id):
+        with self._lock:
+            self._summaries.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "budget_tokens": self.budget_tokens,
+                "keep_turns": self.keep_turns,
+                "exact_token_counts": self.counter.exact,
+                "sessions_summarized": len(self._summaries),
+                "summaries_pending": len(self._pending),
+                "summaries_written": self._summaries_written,
+                "summary_failures": self._failures,
+                "requests": self._requests,
+                # history tokens actually sent vs. what the plain window would have sent
+                "tokens_sent": self._tokens_sent,
+                "tokens_window": self._tokens_window,
+            }
+
+
+def create_history_compactor(store, summarize, window=None):
+    return HistoryCompactor(
+        store, summarize,
+        budget_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "2000")),
+        keep_turns=int(os.getenv("CHAT_HISTORY_TURNS", "6")),
+        window=window,
+        enabled=os.getenv("CHAT_HISTORY_COMPACTION", "1") == "1",
+    )
@@ -0,0 +1,153 @@
+"""
+Shared keep-alive HTTP client for upstream REST calls (OpenAI realtime).
+
+One pooled session per process replaces the bare requests.post calls, so repeated calls
+to the same host reuse TCP+TLS connections instead of handshaking every time.
+
+Tuning (env):
+    HTTP_POOL_SIZE          connections kept per host (default 20)
+    HTTP_POOL_HOSTS         number of per-host pools (default 8)
+    HTTP_CONNECT_TIMEOUT    seconds (default 5)
+    HTTP_READ_TIMEOUT       seconds, used when a call passes no timeout (default 60)
+    HTTP_CONNECT_RETRIES    retries for failed connects only; POSTs are never replayed (default 2)
+    HTTP2=1                 use httpx with HTTP/2 instead of requests
+"""
+import os
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import upstream_error
+
+
+class _HTTPXResponse:
+    """Gives httpx responses the requests attributes callers rely on (.ok)."""
+
+    def __init__(self, response):
+        self._response = response
+
+    @property
+    def ok(self):
+        return self._response.is_success
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class PooledHTTPClient:
+    def __init__(self, pool_size=20, pool_hosts=8, connect_timeout=5.0, read_timeout=60.0,
+                 connect_retries=2, http2=False):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._errors = Counter()
+        if http2:
+            import httpx
+
+            # httpx ignores Client(limits=...) once a transport is given; the limits go here
+            self._transport = httpx.HTTPTransport(
+                http2=True,
+                retries=connect_retries,
+                limits=httpx.Limits(max_connections=pool_size * pool_hosts,
+                                    max_keepalive_connections=pool_size),
+            )
+            self._session = httpx.Client(transport=self._transport)
+        else:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_hosts,
+                pool_maxsize=pool_size,
+                # connect errors are retried for any method (nothing was sent); reads never are
+                max_retries=Retry(total=connect_retries, connect=connect_retries, read=0, status=0),
+            )
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+            self._adapter = adapter
+
+    def request(self, method, url, *, data=None, timeout=None, **kwargs):
+        host = urlsplit(url).netloc
+        timeout = timeout or self.read_timeout
+        with self._lock:
+            self._requests[host] += 1
+        try:
+            if self.http2:
+                import httpx
+
+                return _HTTPXResponse(self._session.request(
+                    method, url, content=data,
+                    timeout=httpx.Timeout(timeout, connect=self.connect_timeout), **kwargs
+                ))
+            return self._session.request(
+                method, url, data=data, timeout=(self.connect_timeout, timeout), **kwargs
+            )
+        except Exception:
+            with self._lock:
+                self._errors[host] += 1
+            upstream_error(host)
+            raise
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def _httpx_pools(self):
+        by_origin = {}
+        for conn in list(self._transport._pool.connections):
+            origin = conn._origin
+            host = f"{origin.scheme.decode()}://{origin.host.decode()}:{origin.port}"
+            entry = by_origin.setdefault(host, {"host": host, "connections_open": 0, "idle": 0})
+            entry["connections_open"] += 1
+            entry["idle"] += conn.is_idle()
+        return list(by_origin.values())
+
+    def stats(self):
+        pools = []
+        if self.http2:
+            pools = self._httpx_pools()
+        else:
+            for key, pool in list(self._adapter.poolmanager.pools._container.items()):
+                pools.append({
+                    "host": f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool else 0,
+                })
+        with self._lock:
+            return {
+                "http2": self.http2,
+                "pool_size": self.pool_size,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "requests": dict(self._requests),
+                "errors": dict(self._errors),
+                "pools": pools,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client():
+    """Process-wide PooledHTTPClient configured from the environment."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PooledHTTPClient(
+                pool_size=int(os.getenv("HTTP_POOL_SIZE", "20")),
+                pool_hosts=int(os.getenv("HTTP_POOL_HOSTS", "8")),
+                connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+                connect_retries=int(os.getenv("HTTP_CONNECT_RETRIES", "2")),
+                http2=os.getenv("HTTP2", "0") == "1",
+            )
+        return _shared
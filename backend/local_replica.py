@@ -0,0 +1,361 @@
+"""
+Local, memory-mapped replica of the Qdrant collection.
+
+Every dense search otherwise costs a network round-trip to QDRANT_HOST. `sync` snapshots the
+collection's vectors (float32, or int8 with one scale per row) and payloads into a directory of
+.npy / blob files, and `LocalReplica` answers searches from it with a vectorized NumPy top-k.
+The files are opened with mmap, so gunicorn workers on one machine share the same pages.
+
+    python -m local_replica sync            # incremental: only new or changed points are fetched
+    python -m local_replica sync --full     # refetch every vector
+
+    LOCAL_REPLICA_PATH     replica directory; when set, app.py / voice.py search it instead of Qdrant
+    LOCAL_REPLICA_DTYPE    float32 (default) or int8 (4x smaller, ~3x slower to scan), used by sync
+    LOCAL_REPLICA_CHECK    seconds between checks for a newer sync (default 10)
+
+Resync is keyed on point ids: a point whose payload digest is unchanged keeps its stored vector.
+Each sync writes a new version directory and then swaps replica.json, so running workers pick
+up the new version on their next check without ever reading a half-written one.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from sparse_index import matches
+
+log = logging.getLogger("local-replica")
+
+MANIFEST = "replica.json"
+DTYPES = ("float32", "int8")
+DISTANCES = ("Cosine", "Dot")
+_CHUNK_ROWS = 8192  # rows scored per matmul, bounds the float32 copy of int8 rows
+
+
+def _digest(payload):
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return int.from_bytes(hashlib.sha1(raw).digest()[:8], "little")
+
+
+def _quantize(vectors):
+    """float32 rows -> (int8 rows, float32 per-row scale) with row ~= scale * int8 row."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ReplicaSnapshot:
+    """One synced version of the replica, opened read-only."""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.collection = manifest["collection"]
+        self.distance = manifest["distance"]
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        scales = os.path.join(directory, "scales.npy")
+        self.scales = np.load(scales, mmap_mode="r") if os.path.exists(scales) else None
+        self.digests = np.load(os.path.join(directory, "digests.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.payloads = np.memmap(os.path.join(directory, "payloads.bin"), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] else np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(directory, "ids.json"), encoding="utf-8") as fp:
+            self.ids = json.load(fp)
+        self._metadata = None  # per-row metadata, decoded on the first filtered search
+        self._rows = None  # point id -> row, built on the first vectors_for()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def payload(self, i):
+        return json.loads(bytes(self.payloads[self.offsets[i]:self.offsets[i + 1]]))
+
+    def document(self, i):
+        # Same shape as QdrantVectorStore._document_from_point
+        payload = self.payload(i)
+        metadata = payload.get("metadata") or {}
+        metadata["_id"] = self.ids[i]
+        metadata["_collection_name"] = self.collection
+        return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+    def documents(self):
+        return [self.document(i) for i in range(len(self))]
+
+    def vectors_for(self, ids):
+        """{point id: float32 vector} for the ids present in this snapshot (scaled back for int8)."""
+        if self._rows is None:
+            with self._lock:
+                if self._rows is None:
+                    self._rows = {pid: row for row, pid in enumerate(self.ids)}
+        rows = [(pid, self._rows[pid]) for pid in ids if pid in self._rows]
+        vectors = {}
+        for pid, row in rows:
+            vector = np.asarray(self.vectors[row], dtype=np.float32)
+            vectors[pid] = vector * self.scales[row] if self.scales is not None else vector
+        return vectors
+
+    def _mask(self, filter):
+        if self._metadata is None:
+            with self._lock:
+                if self._metadata is None:
+                    self._metadata = [self.payload(i).get("metadata") or {} for i in range(len(self))]
+        return np.fromiter((matches(m, filter) for m in self._metadata), dtype=bool, count=len(self))
+
+    def search_many(self, vectors, requests):
+        """
+        vectors: one query vector per (k, filter) request. Scores every row against all
+        queries in one pass over the matrix and returns one [(Document, score)] list each.
+        """
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(requests), -1)
+        if self.distance == "Cosine":
+            queries = _normalize(queries)
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), _CHUNK_ROWS):
+            block = np.asarray(self.vectors[start:start + _CHUNK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+            if self.scales is not None:
+                scores[:, start:start + len(block)] *= self.scales[start:start + len(block)]
+
+        results = []
+        for row, (k, filter) in zip(scores, requests):
+            if filter:
+                row = np.where(self._mask(filter), row, -np.inf)
+            k = min(k, len(row))
+            top = np.argpartition(-row, k - 1)[:k] if 0 < k < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append([(self.document(i), float(row[i])) for i in top if np.isfinite(row[i])])
+        return results
+
+
+def read_snapshot(path):
+    """The snapshot replica.json points at, or None when `path` has not been synced."""
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as fp:
+            manifest = json.load(fp)
+    except FileNotFoundError:
+        return None
+    return ReplicaSnapshot(os.path.join(path, manifest["version"]), manifest)
+
+
+class LocalReplica:
+    """The replica at `path`; reopens itself when a newer sync swaps the manifest."""
+
+    def __init__(self, path, check_interval=10.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._warned = False
+
+    def _open(self):
+        try:
+            mtime = os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            if not self._warned:
+                log.warning("No local replica at %s (run: python -m local_replica sync), using Qdrant", self.path)
+                self._warned = True
+            return
+        if mtime == self._mtime:
+            return
+        self._snapshot = read_snapshot(self.path)
+        self._mtime = mtime
+        manifest = self._snapshot.manifest
+        log.info("Local replica %s opened: %d points (%s)", manifest["version"], manifest["count"], manifest["dtype"])
+
+    def get(self):
+        """The current snapshot, or None when nothing has been synced yet."""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._open()
+                    self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def search(self, vector, k=4, filter=None):
+        return self.search_batch([vector], [(k, filter)])[0]
+
+    def search_batch(self, vectors, requests):
+        snapshot = self.get()
+        with self._lock:
+            self._searches += len(requests)
+        return snapshot.search_many(vectors, requests)
+
+    def documents(self):
+        return self.get().documents()
+
+    def stats(self):
+        snapshot = self._snapshot
+        manifest = snapshot.manifest if snapshot else {}
+        return {
+            "path": self.path,
+            "version": manifest.get("version"),
+            "points": manifest.get("count", 0),
+            "dtype": manifest.get("dtype"),
+            "distance": manifest.get("distance"),
+            "bytes": snapshot.vectors.nbytes + snapshot.payloads.nbytes if snapshot else 0,
+            "synced_at": manifest.get("synced_at"),
+            "searches": self._searches,
+        }
+
+
+def create_local_replica():
+    """LocalReplica at LOCAL_REPLICA_PATH, or None when the replica mode is off."""
+    path = os.getenv("LOCAL_REPLICA_PATH")
+    if not path:
+        return None
+    return LocalReplica(path, check_interval=float(os.getenv("LOCAL_REPLICA_CHECK", "10")))
+
+
+# === SYNC ===
+
+def _collection_distance(client, collection, vector_name):
+    vectors = client.get_collection(collection).config.params.vectors
+    params = vectors[vector_name] if isinstance(vectors, dict) else vectors
+    distance = getattr(params.distance, "value", str(params.distance))
+    if distance not in DISTANCES:
+        raise ValueError(f"Local replica supports {' / '.join(DISTANCES)} collections, not {distance}")
+    return distance
+
+
+def _fetch_vectors(client, collection, ids, vector_name, page_size):
+    vectors = {}
+    for start in range(0, len(ids), page_size):
+        for point in client.retrieve(collection, ids=ids[start:start + page_size],
+                                     with_payload=False, with_vectors=True):
+            vector = point.vector[vector_name] if isinstance(point.vector, dict) else point.vector
+            vectors[point.id] = vector
+    return vectors
+
+
+def sync(client, collection, path, dtype="float32", vector_name="", full=False, page_size=256):
+    """
+    Snapshot `collection` into `path`. Unless `full`, vectors of points whose id and payload
+    digest match the current replica are reused and only the rest are fetched.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+    start = time.perf_counter()
+    distance = _collection_distance(client, collection, vector_name)
+
+    ids, payloads, offset = [], [], None
+    while True:
+        points, offset = client.scroll(collection, limit=page_size, offset=offset,
+                                       with_payload=True, with_vectors=False)
+        for point in points:
+            ids.append(point.id)
+            payloads.append(point.payload or {})
+        if offset is None:
+            break
+    digests = np.fromiter((_digest(p) for p in payloads), dtype=np.uint64, count=len(payloads))
+
+    previous = read_snapshot(path)
+    reusable = {}
+    if previous is not None and not full and previous.manifest["dtype"] == dtype \
+            and previous.manifest["collection"] == collection and previous.distance == distance:
+        reusable = {pid: row for row, pid in enumerate(previous.ids)}
+    keep = [reusable.get(pid) for pid in ids]
+    keep = [row if row is not None and previous.digests[row] == digest else None
+            for row, digest in zip(keep, digests)]
+    missing = [pid for pid, row in zip(ids, keep) if row is None]
+    fetched = _fetch_vectors(client, collection, missing, vector_name, page_size)
+
+    dim = len(next(iter(fetched.values()))) if fetched else (previous.vectors.shape[1] if previous else 0)
+    vectors = np.zeros((len(ids), dim), dtype=np.int8 if dtype == "int8" else np.float32)
+    scales = np.ones(len(ids), dtype=np.float32) if dtype == "int8" else None
+    fresh_rows = [i for i, row in enumerate(keep) if row is None]
+    if fresh_rows:
+        fresh = np.asarray([fetched[ids[i]] for i in fresh_rows], dtype=np.float32)
+        if distance == "Cosine":
+            fresh = _normalize(fresh)
+        if dtype == "int8":
+            vectors[fresh_rows], scales[fresh_rows] = _quantize(fresh)
+        else:
+            vectors[fresh_rows] = fresh
+    kept_rows = [i for i, row in enumerate(keep) if row is not None]
+    if kept_rows:
+        old_rows = [keep[i] for i in kept_rows]
+        vectors[kept_rows] = previous.vectors[old_rows]
+        if scales is not None:
+            scales[kept_rows] = previous.scales[old_rows]
+
+    version = f"v{time.time_ns()}"
+    directory = os.path.join(path, version)
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    if scales is not None:
+        np.save(os.path.join(directory, "scales.npy"), scales)
+    np.save(os.path.join(directory, "digests.npy"), digests)
+    blobs = [json.dumps(p, ensure_ascii=False).encode("utf-8") for p in payloads]
+    np.save(os.path.join(directory, "offsets.npy"),
+            np.concatenate([[0], np.cumsum([len(b) for b in blobs], dtype=np.int64)]).astype(np.int64))
+    with open(os.path.join(directory, "payloads.bin"), "wb") as fp:
+        fp.write(b"".join(blobs))
+    with open(os.path.join(directory, "ids.json"), "w", encoding="utf-8") as fp:
+        json.dump(ids, fp)
+
+    manifest = {
+        "version": version, "collection": collection, "dtype": dtype, "dim": dim,
+        "distance": distance, "vector_name": vector_name, "count": len(ids),
+        "synced_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    tmp = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+    # Keep the version workers may still have open; older ones are no longer referenced
+    live = {version, previous.manifest["version"] if previous else None}
+    for name in os.listdir(path):
+        if name.startswith("v") and name not in live and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    summary = {"version": version, "points": len(ids), "fetched": len(fresh_rows),
+               "reused": len(kept_rows), "seconds": round(time.perf_counter() - start, 2)}
+    log.info("Local replica synced: %s", summary)
+    return summary
+
+
+def main(argv=None):
+    import qdrant_client
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog="python -m local_replica", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("sync", help="snapshot the Qdrant collection into LOCAL_REPLICA_PATH")
+    cmd.add_argument("--path", default=os.getenv("LOCAL_REPLICA_PATH"))
+    cmd.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION_NAME"))
+    cmd.add_argument("--dtype", choices=DTYPES, default=os.getenv("LOCAL_REPLICA_DTYPE", "float32"))
+    cmd.add_argument("--vector-name", default="", help="named vector to copy (default: the unnamed one)")
+    cmd.add_argument("--full", action="store_true", help="refetch every vector")
+    args = parser.parse_args(argv)
+    if not args.path or not args.collection:
+        parser.error("set LOCAL_REPLICA_PATH and QDRANT_COLLECTION_NAME (or pass --path / --collection)")
+
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(args.path, exist_ok=True)
+    client = qdrant_client.QdrantClient(url=os.getenv("QDRANT_HOST"), api_key=os.getenv("QDRANT_API_KEY"))
+    print(json.dumps(sync(client, args.collection, args.path, dtype=args.dtype,
+                          vector_name=args.vector_name, full=args.full)))
+
+
+if __name__ == "__main__":
+    main()
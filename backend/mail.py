@@ -3,6 +3,7 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import resend
+from metrics import instrument_flask, stage, upstream_error
 
 # Load environment variables
 load_dotenv()
@@ -13,6 +14,7 @@ CORS(app, origins=["https://ai-platform-dash.onrender.com"])
 # Resend setup
 resend.api_key = os.getenv("RESEND_API_KEY")
 RECEIVER_EMAIL = os.getenv("RECEIVER_EMAIL")
+instrument_flask(app)
 
 @app.route("/contact", methods=["POST"])
 def contact():
@@ -25,19 +27,25 @@ def contact():
         return jsonify({"success": False, "message": "All fields are required."}), 400
 
     try:
+        message_html = message.replace("\n", "<br>")
         html_content = f"""
             <p><strong>Name:</strong> {name}</p>
             <p><strong>Email:</strong> {email}</p>
-            <p><strong>Message:</strong><br>{message.replace('\n', '<br>')}</p>
+            <p><strong>Message:</strong><br>{message_html}</p>
         """
 
-        r = resend.Emails.send({
-            "from": "onboarding@resend.dev",  # Keep default unless domain is verified
-            "to": RECEIVER_EMAIL,
-            "subject": f"New Contact Message from {name}",
-            "reply_to": email,
-            "html": html_content,
-        })
+        try:
+            with stage("resend"):
+                resend.Emails.send({
+                    "from": "onboarding@resend.dev",  # Keep default unless domain is verified
+                    "to": RECEIVER_EMAIL,
+                    "subject": f"New Contact Message from {name}",
+                    "reply_to": email,
+                    "html": html_content,
+                })
+        except Exception:
+            upstream_error("resend")
+            raise
 
         return jsonify({"success": True, "message": "Message sent!"}), 200
 
@@ -0,0 +1,270 @@
+"""
+Per-route and per-stage latency metrics in Prometheus text format.
+
+    http_request_duration_seconds{route,method,status}   histogram, until the body is fully sent
+    http_requests_in_flight{route}                       gauge
+    stage_duration_seconds{route,stage}                  histogram (rewrite, embedding, qdrant, ttft, ...)
+    upstream_errors_total{upstream}                      counter
+    <name>_<key>                                         gauges from registered stats() collectors
+
+Stages are timed with `with stage("qdrant"):` anywhere below a request; the timings of the
+current request are also sent as a Server-Timing header when the response is not streamed.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(_Histogram)  # (name, labels) -> _Histogram
+        self._counters = defaultdict(float)
+        self._gauges = defaultdict(float)
+        self._collectors = {}
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._histograms[_key(name, labels)].observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += amount
+
+    def gauge_add(self, name, amount, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] += amount
+
+    def register_collector(self, name, stats_fn):
+        """Expose the numeric fields of stats_fn() as gauges named <name>_<field>."""
+        self._collectors[name] = stats_fn
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        seen = set()
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(BUCKETS, hist.counts):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {hist.count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist.count}")
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in series:
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for prefix, stats_fn in sorted(self._collectors.items()):
+            try:
+                stats = stats_fn() or {}
+            except Exception:
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """Stage timings of one request (kept in a ContextVar)."""
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.notes = {}  # per-request facts other than timings (e.g. context token counts)
+        self.finished = False
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        registry.observe("stage_duration_seconds", seconds, route=self.route, stage=name)
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def begin_request(route, method):
+    timings = RequestTimings(route, method)
+    _request.set(timings)
+    registry.gauge_add("http_requests_in_flight", 1, route=route)
+    return timings
+
+
+def end_request(timings, status):
+    if timings is None or timings.finished:
+        return
+    timings.finished = True
+    registry.gauge_add("http_requests_in_flight", -1, route=timings.route)
+    registry.observe(
+        "http_request_duration_seconds",
+        time.perf_counter() - timings.start,
+        route=timings.route, method=timings.method, status=status,
+    )
+
+
+def current_request():
+    return _request.get()
+
+
+def record_stage(name, seconds):
+    timings = _request.get()
+    if timings is not None:
+        timings.record(name, seconds)
+    else:
+        registry.observe("stage_duration_seconds", seconds, route="background", stage=name)
+
+
+def annotate(key, value):
+    """Attach `value` to the current request's notes (no-op outside a request)."""
+    timings = _request.get()
+    if timings is not None:
+        timings.notes[key] = value
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def upstream_error(upstream):
+    registry.inc("upstream_errors_total", upstream=upstream)
+
+
+def instrument_flask(app):
+    """Time every route of a Flask app and serve GET /metrics."""
+    from flask import Response, request
+
+    @app.before_request
+    def _metrics_begin():
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        begin_request(rule, request.method)
+
+    @app.after_request
+    def _metrics_end(response):
+        timings = current_request()
+        if timings is None:
+            return response
+        if not response.is_streamed:
+            response.headers["Server-Timing"] = timings.server_timing()
+        # Streamed bodies are still being sent here; finish once the body is closed.
+        response.call_on_close(lambda: end_request(timings, response.status_code))
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
+
+
+class _EndOnClose:
+    """Async body iterator that finishes the request once the body is exhausted or closed."""
+
+    def __init__(self, iterator, finish):
+        self._iter = iterator
+        self._finish = finish
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._iter.__anext__()
+        except BaseException:
+            # StopAsyncIteration included: the body is done either way
+            self._finish()
+            raise
+
+    async def aclose(self):
+        try:
+            if hasattr(self._iter, "aclose"):
+                await self._iter.aclose()
+        finally:
+            self._finish()
+
+
+def instrument_quart(app):
+    """Quart counterpart of instrument_flask."""
+    from quart import Response, request
+    from quart.wrappers.response import IterableBody
+
+    @app.before_request
+    async def _metrics_begin():
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        begin_request(rule, request.method)
+
+    @app.after_request
+    async def _metrics_end(response):
+        timings = current_request()
+        if timings is None:
+            return response
+        body = response.response
+        if isinstance(body, IterableBody):
+            # Streamed bodies are still being sent here; finish once the body is closed.
+            status = response.status_code
+            body.iter = _EndOnClose(body.iter, lambda: end_request(timings, status))
+        else:
+            response.headers["Server-Timing"] = timings.server_timing()
+            end_request(timings, response.status_code)
+        return response
+
+    @app.get("/metrics")
+    async def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
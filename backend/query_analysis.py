@@ -0,0 +1,24 @@
+import re
+
+# Words that only make sense with earlier turns in view ("what about it?", "explain that more").
+_REFERENTIAL = re.compile(
+    r"\b(it|its|it's|that|this|these|those|they|them|their|he|she|his|her|"
+    r"above|previous|earlier|same|again|more|else|also|instead|another|other|one)\b",
+    re.IGNORECASE,
+)
+_CONTINUATION = re.compile(r"^\s*(and|but|or|so|then|what about|how about|why|ok|okay)\b", re.IGNORECASE)
+
+
+def is_standalone(question):
+    """
+    Cheap local check for questions that can be answered without the chat history.
+
+    A question is treated as standalone when it has no pronouns or back-references
+    and does not start like a continuation of the previous turn.
+    """
+    text = (question or "").strip()
+    if not text:
+        return False
+    if _CONTINUATION.search(text):
+        return False
+    return _REFERENTIAL.search(text) is None
@@ -0,0 +1,135 @@
+"""
+Pre-warmed pool of ephemeral OpenAI realtime / transcription sessions.
+
+Creating the session (POST /realtime/sessions or /realtime/transcription_sessions) is the
+first of two upstream round-trips in every WebRTC connect. The pool keeps `size` fresh
+sessions per config ready, refills them from a background thread and throws them away
+`margin` seconds before their client_secret expires, so a connect only pays for the SDP
+exchange. When the pool is empty the session is created inline, exactly as before.
+
+The upstream URL comes from the caller (OPENAI_BASE_URL), so the pool can be exercised
+against a local stand-in server.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import stage, upstream_error
+
+log = logging.getLogger("realtime-pool")
+
+
+class RealtimeSessionError(Exception):
+    def __init__(self, message, status=502, body=b""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class RealtimeSessionPool:
+    def __init__(self, http_client, url, headers, payload, size=1, margin=15.0,
+                 default_ttl=60.0, name="realtime"):
+        self.http_client = http_client
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.size = size
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self.name = name
+        self._ready = deque()  # (expires_at, client_secret, session json)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._counts = {"created": 0, "served_from_pool": 0, "created_inline": 0,
+                        "expired": 0, "errors": 0}
+
+    def create(self):
+        """Create one session upstream; returns (expires_at, client_secret, session json)."""
+        try:
+            resp = self.http_client.post(
+                self.url, headers=self.headers, data=json.dumps(self.payload), timeout=20
+            )
+        except Exception as e:
+            with self._lock:
+                self._counts["errors"] += 1
+            raise RealtimeSessionError(f"Session error: {e}") from e
+        if not resp.ok:
+            with self._lock:
+                self._counts["errors"] += 1
+            upstream_error(self.name)
+            raise RealtimeSessionError(
+                f"Session create failed ({resp.status_code}): {resp.text}",
+                status=resp.status_code, body=resp.content,
+            )
+        session = resp.json()
+        secret = session.get("client_secret") or {}
+        if not secret.get("value"):
+            with self._lock:
+                self._counts["errors"] += 1
+            raise RealtimeSessionError("Missing client_secret")
+        expires_at = secret.get("expires_at") or time.time() + self.default_ttl
+        with self._lock:
+            self._counts["created"] += 1
+        return expires_at, secret["value"], session
+
+    def start(self):
+        """Start filling the pool now rather than on the first acquire()."""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Started lazily and per process: a thread started before a gunicorn fork is lost.
+        if self.size <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ready.clear()
+        threading.Thread(target=self._refill_loop, name=f"{self.name}-pool", daemon=True).start()
+
+    def _prune(self, now):
+        with self._lock:
+            fresh = deque(s for s in self._ready if s[0] - self.margin > now)
+            self._counts["expired"] += len(self._ready) - len(fresh)
+            self._ready = fresh
+
+    def _refill_loop(self):
+        backoff = 1.0
+        while True:
+            self._prune(time.time())
+            try:
+                while len(self._ready) < self.size:
+                    session = self.create()
+                    with self._lock:
+                        self._ready.append(session)
+                backoff = 1.0
+            except RealtimeSessionError as e:
+                log.warning("[%s] refill failed: %s", self.name, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            with self._lock:
+                next_expiry = min(s[0] for s in self._ready) if self._ready else time.time()
+            self._wakeup.wait(timeout=max(0.5, next_expiry - self.margin - time.time()))
+            self._wakeup.clear()
+
+    def acquire(self):
+        """Return a fresh client_secret, from the pool when possible (single use)."""
+        self._ensure_started()
+        self._prune(time.time())
+        with self._lock:
+            session = self._ready.popleft() if self._ready else None
+            self._counts["served_from_pool" if session else "created_inline"] += 1
+        self._wakeup.set()
+        if session is None:
+            with stage("session_create"):
+                session = self.create()
+        return session[1]
+
+    def stats(self):
+        with self._lock:
+            return {"name": self.name, "size": self.size, "ready": len(self._ready), **self._counts}
@@ -0,0 +1,610 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+
+from metrics import record_stage, stage
+from query_analysis import is_standalone
+
+log = logging.getLogger("retrieval")
+
+# Query rewrites of REWRITE_MODE=parallel (the raw search runs on the request thread);
+# payload index creation has its own pool so it never queues in front of them
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_WORKERS", "16")), thread_name_prefix="retrieval"
+)
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="payload-index")
+
+
+def _submit(fn, *args, **kwargs):
+    # Run in the retrieval pool with the caller's context so stage timings reach its request.
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+
+def mmr_settings():
+    """
+    VectorRetriever MMR fields from the environment:
+    RETRIEVAL_MMR=1 turns re-ranking on, MMR_LAMBDA (0.5; 1 = relevance only) trades
+    relevance for diversity, DEDUP_THRESHOLD (0.95) is the near-duplicate cosine cutoff.
+    """
+    return {
+        "mmr": os.getenv("RETRIEVAL_MMR", "0") == "1",
+        "mmr_lambda": float(os.getenv("MMR_LAMBDA", "0.5")),
+        "dedup_threshold": float(os.getenv("DEDUP_THRESHOLD", "0.95")),
+    }
+
+
+def metadata_filter(conditions):
+    """
+    {"source": "handbook.pdf", "card_id": [1, 2]} -> Qdrant Filter on metadata.<key>
+    (a list matches any of its values). None for no conditions.
+    """
+    if not conditions:
+        return None
+    from qdrant_client import models
+
+    must = []
+    for key, value in conditions.items():
+        match = models.MatchAny(any=value) if isinstance(value, list) else models.MatchValue(value=value)
+        must.append(models.FieldCondition(key=f"metadata.{key}", match=match))
+    return models.Filter(must=must)
+
+
+def filter_conditions(conditions, allowed):
+    """
+    Validated metadata filter for a search request: an object of `allowed` key -> string,
+    integer or boolean, or a non-empty list of all strings or all integers (what Qdrant's
+    MatchValue / MatchAny accept). None means no filter.
+    """
+    if conditions is None:
+        return None, None
+    if not isinstance(conditions, dict):
+        return None, "filter must be an object of metadata field -> value"
+    for key, value in conditions.items():
+        if key not in allowed:
+            return None, f"Unsupported filter field: {key} (use one of {', '.join(sorted(allowed)) or 'none'})"
+        if isinstance(value, list):
+            # type() rather than isinstance(): bool is an int, and MatchAny takes no booleans
+            valid = bool(value) and (all(type(v) is str for v in value) or all(type(v) is int for v in value))
+        else:
+            valid = isinstance(value, (str, int))
+        if not valid:
+            return None, (f"filter.{key} must be a string, integer or boolean, "
+                          "or a non-empty list of strings or of integers")
+    return conditions or None, None
+
+
+def payload_fields(fields):
+    """
+    Validated projection list for a search request: "content" (the chunk text) and/or
+    metadata keys. None means the full payload.
+    """
+    if fields is None:
+        return None, None
+    if not isinstance(fields, list) or not all(isinstance(f, str) and f for f in fields):
+        return None, "fields must be a list of metadata keys (and/or \"content\")"
+    return fields, None
+
+
+def payload_selector(fields, content_key="page_content", metadata_key="metadata"):
+    """Qdrant with_payload value that only transfers the projected fields."""
+    if fields is None:
+        return True
+    from qdrant_client import models
+
+    include = [f"{metadata_key}.{key}" for key in fields if key != "content"]
+    if "content" in fields:
+        include.append(content_key)
+    return models.PayloadSelectorInclude(include=include)
+
+
+def project(doc, fields):
+    """Copy of `doc` keeping only the requested fields (see payload_fields)."""
+    if fields is None:
+        return doc
+    metadata = {key: doc.metadata[key] for key in fields if key in doc.metadata}
+    return Document(page_content=doc.page_content if "content" in fields else "", metadata=metadata)
+
+
+class PayloadIndexes:
+    """
+    Qdrant payload indexes for the metadata fields searches filter on, so filtered queries
+    use an index instead of checking every point's payload. `fields` ({key: schema}) is also
+    the allowlist of filterable keys: the indexes are created by ensure_configured() during
+    warm-up, or in the background the first time a filter uses the key.
+    """
+
+    def __init__(self, vector_store, fields=None):
+        self.vector_store = vector_store
+        self.fields = fields or {}
+        self._indexed = None  # payload_schema keys of the collection, read on first use
+        self._lock = threading.Lock()
+        self._created = []
+        self._failed = {}
+
+    def _field(self, key):
+        return f"{self.vector_store.metadata_payload_key}.{key}"
+
+    def _load(self):
+        if self._indexed is None:
+            schema = self.vector_store.client.get_collection(self.vector_store.collection_name).payload_schema
+            with self._lock:
+                if self._indexed is None:
+                    self._indexed = set(schema or {})
+
+    def _create(self, key, schema):
+        # A failed field stays claimed: no retry per request against a read-only key or a bad schema
+        store = self.vector_store
+        try:
+            store.client.create_payload_index(store.collection_name, field_name=self._field(key),
+                                              field_schema=schema, wait=False)
+        except Exception as e:
+            log.warning("Payload index on %s failed: %s", self._field(key), e)
+            with self._lock:
+                self._failed[key] = str(e)
+            return
+        with self._lock:
+            self._created.append(key)
+        log.info("Payload index created on %s (%s)", self._field(key), schema)
+
+    def _claim(self, key):
+        with self._lock:
+            if self._field(key) in self._indexed:
+                return False
+            self._indexed.add(self._field(key))
+            return True
+
+    def ensure_configured(self):
+        self._load()
+        for key, schema in self.fields.items():
+            if self._claim(key):
+                self._create(key, schema)
+
+    def _ensure(self, conditions):
+        try:
+            self._load()
+        except Exception as e:
+            log.warning("Reading the payload schema failed: %s", e)
+            return
+        for key in conditions:
+            if key in self.fields and self._claim(key):
+                self._create(key, self.fields[key])
+
+    def ensure(self, conditions):
+        """
+        Indexes the configured keys of a metadata_filter() dict that have none yet, in the
+        background. Other keys are never indexed; filter_conditions() rejects them.
+        """
+        keys = [key for key in conditions or () if key in self.fields]
+        if keys and (self._indexed is None or any(self._field(k) not in self._indexed for k in keys)):
+            _index_executor.submit(self._ensure, keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexed": sorted(self._indexed) if self._indexed is not None else None,
+                "created": list(self._created),
+                "failed": dict(self._failed),
+            }
+
+
+def create_payload_indexes(vector_store):
+    """
+    SEARCH_INDEXED_FIELDS="source:keyword,card_id:integer" lists the metadata fields searches
+    may filter on, each with its index schema (default: source).
+    """
+    fields = {}
+    for item in filter(None, (f.strip() for f in os.getenv("SEARCH_INDEXED_FIELDS", "source:keyword").split(","))):
+        key, _, schema = item.partition(":")
+        fields[key] = schema or "keyword"
+    return PayloadIndexes(vector_store, fields)
+
+
+class VectorRetriever(BaseRetriever):
+    """
+    Retriever over a LangChain QdrantVectorStore that embeds the query itself, so the
+    embedding and the Qdrant search are timed as separate stages.
+
+    Searches go straight to client.query_points: the store's own similarity_search_*
+    re-reads the collection config (one more Qdrant round-trip) on every call.
+
+    mode="sparse" ranks with the BM25 `sparse_index` only, mode="hybrid" fuses the dense
+    and BM25 rankings (each `candidates` deep) with reciprocal rank fusion, so exact
+    matches on drug names and codes surface even when their embedding is a poor match.
+
+    With a `replica` (local_replica.LocalReplica) that has been synced, dense searches run
+    in-process against it and Qdrant is not contacted at all; `embeddings` then saves
+    building the vector store just to embed the query.
+
+    mmr=True fetches `candidates` results with their vectors and re-ranks them with
+    maximal_marginal_relevance(), dropping chunks whose cosine to an already chosen one
+    is at least `dedup_threshold` (overlapping handbook chunks are often near-copies).
+
+    search() also takes a `score_threshold` (pushed down to Qdrant) and a `fields`
+    projection, which trims the payload Qdrant sends back to just those fields.
+    """
+
+    vector_store: Any
+    k: int = 4
+    mode: str = "dense"
+    sparse_index: Any = None  # sparse_index.SparseIndex, required for sparse / hybrid
+    candidates: int = 20
+    replica: Any = None
+    embeddings: Any = None  # defaults to vector_store.embeddings
+    mmr: bool = False
+    mmr_lambda: float = 0.5
+    dedup_threshold: float = 0.95
+    payload_indexes: Any = None  # PayloadIndexes, indexes filtered fields on first use
+
+    def _embeddings(self):
+        return self.embeddings or self.vector_store.embeddings
+
+    def uses_replica(self):
+        return self.replica is not None and self.replica.get() is not None
+
+    def _vector_selector(self):
+        # with_vectors value that returns the store's vector (named or the unnamed default)
+        return [self.vector_store.vector_name] if self.vector_store.vector_name else True
+
+    def _point_vector(self, point):
+        vector = point.vector
+        return vector.get(self.vector_store.vector_name) if isinstance(vector, dict) else vector
+
+    def _documents(self, points, vectors=None):
+        store = self.vector_store
+        results = []
+        for p in points:
+            doc = store._document_from_point(p, store.collection_name, store.content_payload_key,
+                                             store.metadata_payload_key)
+            if vectors is not None:
+                vectors[_doc_key(doc)] = self._point_vector(p)
+            results.append((doc, p.score))
+        return results
+
+    def _dense(self, vector, k, filter, vectors=None, score_threshold=None, fields=None):
+        """Dense top-k; when `vectors` is a dict, the hits' vectors are collected into it."""
+        if self.uses_replica():
+            with stage("replica"):
+                results = self.replica.search(vector, k=k, filter=filter)
+            if score_threshold is not None:
+                results = [(doc, score) for doc, score in results if score >= score_threshold]
+            return results
+        if self.payload_indexes is not None:
+            self.payload_indexes.ensure(filter)
+        store = self.vector_store
+        with stage("qdrant"):
+            points = store.client.query_points(
+                store.collection_name, query=vector, using=store.vector_name or None,
+                query_filter=metadata_filter(filter), limit=k, score_threshold=score_threshold,
+                with_payload=payload_selector(fields, store.content_payload_key, store.metadata_payload_key),
+                with_vectors=self._vector_selector() if vectors is not None else False,
+            ).points
+        return self._documents(points, vectors)
+
+    def _sparse(self, query, k, filter, score_threshold=None):
+        with stage("bm25"):
+            results = self.sparse_index.search(query, k=k, filter=filter)
+        if score_threshold is not None:
+            results = [(doc, score) for doc, score in results if score >= score_threshold]
+        return results
+
+    def _fetch_vectors(self, docs):
+        """{doc key: vector} for documents found without their vectors (BM25 hits, replica hits)."""
+        ids = [doc.metadata["_id"] for doc in docs]
+        if self.uses_replica():
+            by_id = self.replica.get().vectors_for(ids)
+        else:
+            store = self.vector_store
+            with stage("qdrant"):
+                points = store.client.retrieve(store.collection_name, ids=ids, with_payload=False,
+                                               with_vectors=self._vector_selector())
+            by_id = {p.id: self._point_vector(p) for p in points}
+        return {_doc_key(doc): by_id[doc.metadata["_id"]] for doc in docs if doc.metadata["_id"] in by_id}
+
+    def _rerank(self, vector, results, k, vectors):
+        missing = [doc for doc, _ in results if _doc_key(doc) not in vectors]
+        if missing:
+            vectors.update(self._fetch_vectors(missing))
+        results = [(doc, score) for doc, score in results if _doc_key(doc) in vectors]
+        if not results:
+            return results
+        with stage("rerank"):
+            order = maximal_marginal_relevance(
+                vector, [vectors[_doc_key(doc)] for doc, _ in results], k,
+                lambda_mult=self.mmr_lambda, dedup_threshold=self.dedup_threshold,
+            )
+        return [results[i] for i in order]
+
+    def _rank(self, query, vector, k, filter, mode, vectors, score_threshold=None, fields=None):
+        if mode == "dense":
+            return self._dense(vector, k, filter, vectors, score_threshold, fields)
+        if mode == "sparse":
+            return self._sparse(query, k, filter, score_threshold)
+        depth = max(k, self.candidates)
+        return reciprocal_rank_fusion(
+            [self._dense(vector, depth, filter, vectors, score_threshold, fields), self._sparse(query, depth, filter)],
+            limit=k,
+        )
+
+    def search(self, query, k=None, filter=None, mode=None, mmr=None, score_threshold=None, fields=None):
+        """
+        Returns [(Document, score)] for `query`; filter is a metadata_filter() dict. Scores
+        are cosine (dense), BM25 (sparse) or fused reciprocal-rank scores (hybrid); MMR
+        re-ranking keeps each result's original score.
+
+        score_threshold drops hits scoring below it: cosine for dense and hybrid (applied to
+        the dense candidates before fusion), BM25 for sparse. `fields` (see payload_fields)
+        projects the returned documents.
+        """
+        k = k or self.k
+        mode = mode or self.mode
+        mmr = self.mmr if mmr is None else mmr
+        if mode == "sparse" and not mmr:
+            results = self._sparse(query, k, filter, score_threshold)
+        else:
+            vector = self._embeddings().embed_query(query)
+            if not mmr:
+                results = self._rank(query, vector, k, filter, mode, None, score_threshold, fields)
+            else:
+                vectors = {}
+                results = self._rank(query, vector, max(k, self.candidates), filter, mode, vectors,
+                                     score_threshold, fields)
+                results = self._rerank(vector, results, k, vectors)
+        return [(project(doc, fields), score) for doc, score in results] if fields is not None else results
+
+    def search_batch(self, queries, mode=None, mmr=None):
+        """
+        [(query, k, filter)] -> one [(Document, score)] list per query, in order, using
+        a single embeddings request and a single Qdrant batch query (or replica pass).
+        """
+        from qdrant_client import models
+
+        mode = mode or self.mode
+        mmr = self.mmr if mmr is None else mmr
+        if mode == "sparse" and not mmr:
+            return [self._sparse(query, k or self.k, filter) for query, k, filter in queries]
+        depth = (lambda k: max(k, self.candidates)) if mode == "hybrid" or mmr else (lambda k: k)
+        query_vectors = self._embeddings().embed_documents([query for query, _, _ in queries])
+        vectors = {} if mmr else None
+        if mode == "sparse":
+            dense = [[] for _ in queries]
+        elif self.uses_replica():
+            with stage("replica"):
+                dense = self.replica.search_batch(
+                    query_vectors, [(depth(k or self.k), filter) for _, k, filter in queries]
+                )
+        else:
+            store = self.vector_store
+            with_vectors = self._vector_selector() if mmr else False
+            requests = [
+                models.QueryRequest(query=vector, using=store.vector_name or None, limit=depth(k or self.k),
+                                    filter=metadata_filter(filter), with_payload=True, with_vector=with_vectors)
+                for vector, (_, k, filter) in zip(query_vectors, queries)
+            ]
+            with stage("qdrant"):
+                responses = store.client.query_batch_points(store.collection_name, requests=requests)
+            dense = [self._documents(response.points, vectors) for response in responses]
+
+        batches = []
+        for ranking, vector, (query, k, filter) in zip(dense, query_vectors, queries):
+            k = k or self.k
+            if mode == "sparse":
+                ranking = self._sparse(query, depth(k), filter)
+            elif mode == "hybrid":
+                ranking = reciprocal_rank_fusion([ranking, self._sparse(query, depth(k), filter)], limit=depth(k))
+            batches.append(self._rerank(vector, ranking, k, vectors) if mmr else ranking[:k])
+        return batches
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # Copies: the sparse index and the replica hand out shared Document objects. The score
+        # lets context assembly order and cut the chunks (context_assembly.py)
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "relevance_score": score})
+            for doc, score in self.search(query)
+        ]
+
+
+def _doc_key(doc):
+    return doc.metadata.get("_id") or doc.page_content
+
+
+def merge_documents(primary, secondary, limit=None):
+    """Interleave two result lists, dropping duplicates; primary wins ties."""
+    merged, seen = [], set()
+    for i in range(max(len(primary), len(secondary))):
+        for docs in (primary, secondary):
+            if i < len(docs) and _doc_key(docs[i]) not in seen:
+                seen.add(_doc_key(docs[i]))
+                merged.append(docs[i])
+    return merged[:limit] if limit else merged
+
+
+def maximal_marginal_relevance(query_vector, vectors, k, lambda_mult=0.5, dedup_threshold=None):
+    """
+    Indices of up to `k` rows of `vectors`, picked greedily by
+    lambda * cos(query, row) - (1 - lambda) * max cos(row, picked rows).
+
+    All pairwise cosines come from one matrix product; a row whose cosine to a picked row
+    reaches `dedup_threshold` is never picked, so fewer than k indices may come back.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    relevance = matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = matrix @ matrix.T
+    redundancy = np.zeros(len(matrix), dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+    picked = []
+    while len(picked) < k and available.any():
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        i = int(np.argmax(scores))
+        picked.append(i)
+        available[i] = False
+        redundancy = similarity[i].copy() if len(picked) == 1 else np.maximum(redundancy, similarity[i])
+        if dedup_threshold is not None:
+            available &= similarity[i] < dedup_threshold
+    return picked
+
+
+def reciprocal_rank_fusion(rankings, limit, k=60):
+    """
+    Fuse several [(Document, score)] rankings: each document scores sum(1 / (k + rank)).
+    Returns [(Document, fused score)] best first; the first ranking's copy of a document wins.
+    """
+    fused, docs = {}, {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    best = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [(docs[key], fused[key]) for key in best]
+
+
+class AdaptiveHistoryAwareRetriever:
+    """
+    Drop-in replacement for create_history_aware_retriever that only pays for the
+    LLM query rewrite when the question actually depends on the conversation.
+
+    mode="adaptive": raw input is used for an empty history and for questions
+                     query_analysis.is_standalone() accepts; everything else is rewritten.
+    mode="always":   every request with history is rewritten (LangChain behaviour).
+    mode="parallel": like adaptive, but when a rewrite is needed the raw input is
+                     searched at the same time; both result sets are merged, and if
+                     the rewrite misses `deadline` seconds the raw results are used alone.
+    """
+
+    def __init__(self, llm, retriever, prompt, mode="adaptive", deadline=1.5):
+        self.retriever = retriever
+        self.rewrite_chain = prompt | llm | StrOutputParser()
+        self.mode = mode
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._rewrite_ms = None  # moving average of the rewrite call, used to estimate savings
+        # rewrite_cancelled: late rewrites stopped before / while calling the LLM;
+        # rewrite_discarded: late rewrites already running in a thread, result thrown away
+        self._counts = {"rewrite": 0, "empty_history": 0, "standalone": 0, "deadline_missed": 0,
+                        "rewrite_cancelled": 0, "rewrite_discarded": 0}
+        self._saved_ms = 0.0
+
+    def decide(self, inputs):
+        """Return the reason the rewrite can be skipped, or "rewrite"."""
+        if not inputs.get("chat_history"):
+            return "empty_history"
+        if self.mode in ("adaptive", "parallel") and is_standalone(inputs["input"]):
+            return "standalone"
+        return "rewrite"
+
+    def rewrite(self, inputs, config=None):
+        start = time.perf_counter()
+        query = self.rewrite_chain.invoke(inputs, config=config)
+        self._record_rewrite(inputs, query, start)
+        return query
+
+    async def arewrite(self, inputs, config=None):
+        start = time.perf_counter()
+        query = await self.rewrite_chain.ainvoke(inputs, config=config)
+        self._record_rewrite(inputs, query, start)
+        return query
+
+    def _record_rewrite(self, inputs, query, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record_stage("rewrite", elapsed_ms / 1000)
+        with self._lock:
+            self._rewrite_ms = elapsed_ms if self._rewrite_ms is None else (
+                0.8 * self._rewrite_ms + 0.2 * elapsed_ms
+            )
+        log.info("Query rewrite took %.0f ms: %r -> %r", elapsed_ms, inputs["input"], query)
+
+    def _record_skip(self, decision):
+        with self._lock:
+            self._counts[decision] += 1
+            saved = self._rewrite_ms or 0.0
+            self._saved_ms += saved
+        log.info("Query rewrite skipped (%s), ~%.0f ms saved", decision, saved)
+
+    def _retrieve_parallel(self, inputs, config=None):
+        # Only the rewrite goes to the pool: the raw search runs here, so it never waits
+        # for a pool thread behind other requests' slow rewrite calls
+        start = time.perf_counter()
+        rewritten = _submit(self.rewrite, inputs, config)
+        raw_docs = self.retriever.invoke(inputs["input"], config=config)
+        try:
+            query = rewritten.result(timeout=max(self.deadline - (time.perf_counter() - start), 0))
+        except FutureTimeout:
+            # Still queued: never starts its LLM call. Already running: cannot be stopped
+            cancelled = rewritten.cancel()
+            with self._lock:
+                self._counts["deadline_missed"] += 1
+                self._counts["rewrite_cancelled" if cancelled else "rewrite_discarded"] += 1
+            log.info("Query rewrite missed the %.0f ms deadline, using raw results", self.deadline * 1000)
+            return raw_docs
+        docs = self.retriever.invoke(query, config=config)
+        return merge_documents(docs, raw_docs, limit=max(len(docs), len(raw_docs)))
+
+    def _retrieve(self, inputs, config=None):
+        decision = self.decide(inputs)
+        if decision == "rewrite":
+            with self._lock:
+                self._counts["rewrite"] += 1
+            if self.mode == "parallel":
+                return self._retrieve_parallel(inputs, config)
+            query = self.rewrite(inputs, config)
+        else:
+            self._record_skip(decision)
+            query = inputs["input"]
+        return self.retriever.invoke(query, config=config)
+
+    async def _aretrieve_parallel(self, inputs, config=None):
+        raw = asyncio.ensure_future(self.retriever.ainvoke(inputs["input"], config=config))
+        try:
+            query = await asyncio.wait_for(self.arewrite(inputs, config), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            # wait_for() has cancelled the rewrite task, aborting its LLM request
+            with self._lock:
+                self._counts["deadline_missed"] += 1
+                self._counts["rewrite_cancelled"] += 1
+            log.info("Query rewrite missed the %.0f ms deadline, using raw results", self.deadline * 1000)
+            return await raw
+        docs, raw_docs = await asyncio.gather(self.retriever.ainvoke(query, config=config), raw)
+        return merge_documents(docs, raw_docs, limit=max(len(docs), len(raw_docs)))
+
+    async def _aretrieve(self, inputs, config=None):
+        decision = self.decide(inputs)
+        if decision == "rewrite":
+            with self._lock:
+                self._counts["rewrite"] += 1
+            if self.mode == "parallel":
+                return await self._aretrieve_parallel(inputs, config)
+            query = await self.arewrite(inputs, config)
+        else:
+            self._record_skip(decision)
+            query = inputs["input"]
+        return await self.retriever.ainvoke(query, config=config)
+
+    def as_runnable(self):
+        return RunnableLambda(self._retrieve, afunc=self._aretrieve).with_config(run_name="chat_retriever_chain")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "deadline_ms": self.deadline * 1000,
+                **self._counts,
+                "avg_rewrite_ms": round(self._rewrite_ms or 0.0, 1),
+                "estimated_saved_ms": round(self._saved_ms, 1),
+            }
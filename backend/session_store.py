@@ -0,0 +1,273 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    Bounded in-memory chat history keyed by session_id.
+
+      - least-recently-used sessions are evicted once max_sessions is reached
+      - sessions idle for longer than ttl_seconds are expired
+      - each session keeps at most max_messages messages (oldest dropped first)
+    """
+
+    def __init__(self, max_sessions=1000, ttl_seconds=3600, max_messages=40):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()  # session_id -> (last_access, [messages])
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._expired = 0
+        self._trimmed = 0
+
+    def _expire(self, now):
+        # OrderedDict is kept in access order, so idle sessions sit at the front.
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self._expired += 1
+
+    def get(self, session_id, limit=None):
+        """Return a copy of the session's last `limit` messages (empty list if unknown)."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            messages = entry[1][-limit:] if limit else entry[1]
+            return list(messages)
+
+    def append(self, session_id, user_input, answer):
+        """Record one user/assistant turn."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            messages = entry[1] if entry else []
+            messages.append({"role": "user", "content": user_input})
+            messages.append({"role": "assistant", "content": answer})
+            overflow = len(messages) - self.max_messages
+            if overflow > 0:
+                del messages[:overflow]
+                self._trimmed += overflow
+            self._sessions[session_id] = (now, messages)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+
+    def reset(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "messages": sum(len(m) for _, m in self._sessions.values()),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "max_messages": self.max_messages,
+                "evicted": self._evicted,
+                "expired": self._expired,
+                "trimmed_messages": self._trimmed,
+            }
+
+
+class SQLiteSessionStore:
+    """
+    Chat history shared by every worker process through a SQLite file in WAL mode.
+
+    Each turn is appended as two rows; reads only load the last `limit` messages.
+    TTL expiry, the session cap and the per-session message cap are enforced by a
+    periodic sweep instead of on every write, so the hot path stays append-only; an
+    expired session that is read or written before the sweep is deleted right there.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+    """
+
+    def __init__(self, path, max_sessions=1000, ttl_seconds=3600, max_messages=40,
+                 sweep_interval=30):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._evicted = 0
+        self._expired = 0
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections must not be shared.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expire(self, conn, session_id, now):
+        """Deletes the session's rows if it has expired; call inside a write transaction."""
+        cur = conn.execute(
+            "DELETE FROM sessions WHERE session_id = ? AND last_access <= ?",
+            (session_id, now - self.ttl_seconds),
+        )
+        if cur.rowcount:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._expired += 1
+
+    def get(self, session_id, limit=None):
+        limit = min(limit or self.max_messages, self.max_messages)
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return []
+        if now - row[0] >= self.ttl_seconds:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._expire(conn, session_id, now)
+            return []
+        rows = conn.execute(
+            "SELECT role, content FROM ("
+            "  SELECT id, role, content FROM messages WHERE session_id = ?"
+            "  ORDER BY id DESC LIMIT ?"
+            ") ORDER BY id",
+            (session_id, limit),
+        ).fetchall()
+        conn.execute(
+            "UPDATE sessions SET last_access = ? WHERE session_id = ?",
+            (time.time(), session_id),
+        )
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, session_id, user_input, answer):
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Without this the upsert below would revive an expired session's old messages
+            self._expire(conn, session_id, now)
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, "user", user_input), (session_id, "assistant", answer)],
+            )
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, now),
+            )
+        self._maybe_sweep()
+
+    def reset(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            cur = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cur.rowcount > 0
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            self.sweep(now)
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self, now=None):
+        """Expire idle sessions, evict the least recently used and trim long histories."""
+        now = now or time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            evicted = conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "  SELECT session_id FROM sessions ORDER BY last_access DESC"
+                "  LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_sessions,),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM messages WHERE session_id NOT IN (SELECT session_id FROM sessions)"
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE id IN ("
+                "  SELECT id FROM ("
+                "    SELECT id, ROW_NUMBER() OVER ("
+                "      PARTITION BY session_id ORDER BY id DESC"
+                "    ) AS rn FROM messages"
+                "  ) WHERE rn > ?"
+                ")",
+                (self.max_messages,),
+            )
+        self._expired += expired
+        self._evicted += evicted
+
+    def stats(self):
+        conn = self._conn()
+        sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "messages": messages,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_messages": self.max_messages,
+            # sweep counters are per process
+            "evicted": self._evicted,
+            "expired": self._expired,
+        }
+
+
+def create_session_store():
+    """Build the history backend selected by CHAT_HISTORY_BACKEND (memory | sqlite)."""
+    backend = os.getenv("CHAT_HISTORY_BACKEND", "memory").lower()
+    options = {
+        "max_sessions": int(os.getenv("CHAT_SESSION_MAX", "1000")),
+        "ttl_seconds": int(os.getenv("CHAT_SESSION_TTL", "3600")),
+        "max_messages": int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "40")),
+    }
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("CHAT_HISTORY_DB", "chat_history.db"), **options)
+    if backend != "memory":
+        raise ValueError(f"Unknown CHAT_HISTORY_BACKEND: {backend}")
+    return SessionStore(**options)
@@ -0,0 +1,185 @@
+"""
+In-process BM25 keyword index over the Qdrant collection, for hybrid retrieval.
+
+Dense search ranks drug names, abbreviations and codes ("IL-6", "5-FU", "ICD-10") poorly;
+an exact keyword match does not. The index is built by scrolling the collection's payloads
+(no vectors) and is rebuilt in the background once it is older than `max_age` seconds, so
+newly ingested chunks show up without a restart. Retrieval fuses it with the dense results
+(see retrieval.reciprocal_rank_fusion).
+
+    SPARSE_INDEX_MAX_AGE   seconds before a background rebuild (default 3600)
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+log = logging.getLogger("sparse-index")
+
+# Words plus compound codes such as "il-6", "5-fu", "b12", "icd-10", "0.5mg"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-./]")
+
+
+def tokenize(text):
+    """Lowercased tokens; compounds are also indexed joined ("il6") and split ("il", "6")."""
+    tokens = []
+    for token in _TOKEN.findall((text or "").lower()):
+        tokens.append(token)
+        parts = _SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+            tokens.extend(parts)
+    return tokens
+
+
+def matches(metadata, conditions):
+    """Same semantics as retrieval.metadata_filter: equality, or membership for lists."""
+    for key, value in (conditions or {}).items():
+        allowed = value if isinstance(value, list) else [value]
+        if metadata.get(key) not in allowed:
+            return False
+    return True
+
+
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """documents: LangChain Documents; their metadata is returned with the hits."""
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for i, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        avgdl = float(lengths.mean()) if len(documents) else 0.0
+        n = len(documents)
+        # Per posting BM25 weight with the idf folded in, so a query is a handful of scatter-adds.
+        self._postings = {}
+        for term, entries in postings.items():
+            ids = np.fromiter((i for i, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((t for _, t in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[ids] / (avgdl or 1.0))
+            self._postings[term] = (ids, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def terms(self):
+        return len(self._postings)
+
+    def search(self, query, k=4, filter=None):
+        """Returns [(Document, bm25 score)] best first; only documents matching a query term."""
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if not filter and len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        results = []
+        for i in hits[np.argsort(-scores[hits], kind="stable")]:
+            doc = self.documents[i]
+            if filter and not matches(doc.metadata, filter):
+                continue
+            results.append((doc, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+
+def load_documents(vector_store, page_size=256):
+    """All points of the store's collection as Documents (payload only, no vectors)."""
+    documents, offset = [], None
+    while True:
+        points, offset = vector_store.client.scroll(
+            vector_store.collection_name, limit=page_size, offset=offset,
+            with_payload=True, with_vectors=False,
+        )
+        documents.extend(
+            vector_store._document_from_point(p, vector_store.collection_name,
+                                              vector_store.content_payload_key,
+                                              vector_store.metadata_payload_key)
+            for p in points
+        )
+        if offset is None:
+            return documents
+
+
+class SparseIndex:
+    """A BM25Index over the documents `load()` returns, built on first use and refreshed in the background."""
+
+    def __init__(self, load, max_age=3600.0):
+        self.load = load
+        self.max_age = max_age
+        self._index = None
+        self._built_at = 0.0
+        self._build_seconds = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # one build at a time
+        self._refreshing = False
+
+    def _build(self):
+        # Callers hold _build_lock, so concurrent first searches build the index once.
+        start = time.perf_counter()
+        index = BM25Index(self.load())
+        with self._lock:
+            self._index = index
+            self._built_at = time.time()
+            self._build_seconds = time.perf_counter() - start
+        log.info("BM25 index built: %d documents in %.2fs", len(index), self._build_seconds)
+
+    def _refresh(self):
+        try:
+            with self._build_lock:
+                self._build()
+        except Exception as e:
+            log.warning("BM25 index refresh failed, keeping the old one: %s", e)
+        finally:
+            self._refreshing = False
+
+    def get(self):
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    self._build()
+        elif time.time() - self._built_at > self.max_age and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name="bm25-refresh", daemon=True).start()
+        return self._index
+
+    def search(self, query, k=4, filter=None):
+        return self.get().search(query, k=k, filter=filter)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._index) if self._index is not None else 0,
+                "terms": self._index.terms if self._index is not None else 0,
+                "age_seconds": round(time.time() - self._built_at, 1) if self._index is not None else None,
+                "build_seconds": round(self._build_seconds, 3) if self._build_seconds else None,
+                "max_age": self.max_age,
+            }
+
+
+def create_sparse_index(vector_store, replica=None):
+    """BM25 over the local replica when one is configured (no Qdrant scroll), else over the collection."""
+    def load():
+        if replica is not None and replica.get() is not None:
+            return replica.documents()
+        return load_documents(vector_store)
+
+    return SparseIndex(load, max_age=float(os.getenv("SPARSE_INDEX_MAX_AGE", "3600")))
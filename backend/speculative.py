@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("speculative")
+
+
+def content_key(kind, *parts):
+    raw = json.dumps([kind, *[(p or "").strip() for p in parts]], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SpeculativeJobs:
+    """
+    Background jobs started before the client asks for their result.
+
+    Jobs are keyed by a hash of their kind and inputs (see content_key) and remember the
+    session that started them. run() returns the existing future for a key, whether it is
+    finished or still in flight, and only submits new work when there is none, so a later
+    request never repeats a computation that is already under way. Failed or cancelled jobs
+    are dropped as soon as they finish, so the next request runs them again.
+    """
+
+    def __init__(self, max_workers=8, ttl_seconds=300, max_jobs=1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._jobs = OrderedDict()  # key -> (created, session_id, future)
+        self._lock = threading.Lock()
+        self._counts = {"started": 0, "reused": 0, "on_demand": 0, "failed": 0}
+
+    def _prune(self, now):
+        while self._jobs:
+            key, (created, _, _) = next(iter(self._jobs.items()))
+            if now - created < self.ttl_seconds and len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[key]
+
+    def run(self, key, fn, session_id=None, speculative=False):
+        """Return the future for `key`, submitting fn() only if no job exists yet."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._jobs.get(key)
+            if entry is not None:
+                if not speculative:
+                    self._counts["reused"] += 1
+                return entry[2]
+            future = self._executor.submit(fn)
+            self._jobs[key] = (now, session_id, future)
+            self._counts["started" if speculative else "on_demand"] += 1
+        # Outside the lock: the callback runs right here if the job has already finished
+        future.add_done_callback(lambda f: self._drop_failed(key, f))
+        return future
+
+    def _drop_failed(self, key, future):
+        if not future.cancelled() and future.exception() is None:
+            return
+        with self._lock:
+            entry = self._jobs.get(key)
+            if entry is not None and entry[2] is future:
+                del self._jobs[key]
+            self._counts["failed"] += 1
+
+    def start(self, key, fn, session_id=None):
+        return self.run(key, fn, session_id=session_id, speculative=True)
+
+    def discard_session(self, session_id):
+        with self._lock:
+            for key in [k for k, (_, sid, _) in self._jobs.items() if sid == session_id]:
+                del self._jobs[key]
+
+    def stats(self):
+        with self._lock:
+            return {"jobs": len(self._jobs), "ttl_seconds": self.ttl_seconds, **self._counts}
@@ -0,0 +1,124 @@
+import asyncio
+import itertools
+import re
+from collections import deque
+
+_BOUNDARY = re.compile(r"(?<=[.!?…:;])\s+|\n+")
+_MARKDOWN = re.compile(r"[*_#`>|]+|\[(.*?)\]\(.*?\)")
+
+
+def clean_for_speech(text):
+    """Drop markdown markup so TTS does not read out asterisks and hashes."""
+    text = _MARKDOWN.sub(lambda m: m.group(1) or "", text)
+    return " ".join(text.split())
+
+
+class SentenceSplitter:
+    """
+    Accumulates streamed tokens and hands back complete sentences.
+
+    Sentences shorter than min_chars are held back and merged with the next one,
+    which avoids synthesizing fragments like "1." or "Dr." on their own.
+    """
+
+    def __init__(self, min_chars=24):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, token):
+        self._buffer += token
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()]
+            if len(clean_for_speech(candidate)) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return [clean_for_speech(s) for s in sentences]
+
+    def flush(self):
+        rest, self._buffer = clean_for_speech(self._buffer), ""
+        return [rest] if rest else []
+
+
+def speak_while_streaming(events, synthesize, executor, min_chars=24):
+    """
+    Interleave a streamed answer with audio for each finished sentence.
+
+    `events` yields (event, data) pairs like app.answer_events(). Yields ("text", token)
+    for each token and ("audio", index, sentence, audio_bytes) in sentence order; a
+    sentence whose synthesis failed yields ("audio_error", index, sentence, exception)
+    and the text keeps streaming. Other events ("error", "sources", ...) are passed on
+    as (event, data) and never spoken. Each sentence is submitted to `executor` as soon
+    as it is complete, so synthesis overlaps with generation and audio starts after the
+    first sentence.
+    """
+    splitter = SentenceSplitter(min_chars)
+    pending = deque()  # (index, sentence, future), in sentence order
+    counter = itertools.count()
+
+    def submit(sentences):
+        for sentence in sentences:
+            pending.append((next(counter), sentence, executor.submit(synthesize, sentence)))
+
+    def ready():
+        while pending and pending[0][2].done():
+            yield _result(*pending.popleft())
+
+    try:
+        for event, data in events:
+            if event != "token":
+                yield event, data
+                continue
+            yield "text", data
+            submit(splitter.feed(data))
+            yield from ready()
+        submit(splitter.flush())
+        while pending:
+            yield _result(*pending.popleft())
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+async def aspeak_while_streaming(events, synthesize, min_chars=24):
+    """speak_while_streaming() for an async event iterator and an async `synthesize`."""
+    splitter = SentenceSplitter(min_chars)
+    pending = deque()  # (index, sentence, task), in sentence order
+    counter = itertools.count()
+
+    def submit(sentences):
+        for sentence in sentences:
+            pending.append((next(counter), sentence, asyncio.ensure_future(synthesize(sentence))))
+
+    def ready():
+        done = []
+        while pending and pending[0][2].done():
+            done.append(_result(*pending.popleft()))
+        return done
+
+    try:
+        async for event, data in events:
+            if event != "token":
+                yield event, data
+                continue
+            yield "text", data
+            submit(splitter.feed(data))
+            for item in ready():
+                yield item
+        submit(splitter.flush())
+        while pending:
+            await asyncio.wait([pending[0][2]])
+            yield _result(*pending.popleft())
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+
+def _result(index, sentence, future):
+    # Works for concurrent.futures.Future and asyncio tasks alike
+    error = future.exception()
+    if error is not None:
+        return "audio_error", index, sentence, error
+    return "audio", index, sentence, future.result()
@@ -0,0 +1,233 @@
+"""
+Server-Sent Events framing for the chat stream.
+
+Plain /stream writes every LLM token as its own chunk: thousands of tiny writes and network
+frames per answer, with errors mixed into the text. In SSE mode the answer goes out as typed
+events (token, sources, timing, error, done), and tokens are coalesced: the first token is
+sent at once (time to first token is unchanged), later ones are held for at most
+SSE_COALESCE_MS or until SSE_COALESCE_BYTES have piled up. A comment line is sent every
+SSE_HEARTBEAT_SECONDS of silence (e.g. while retrieval runs) so proxies keep the stream open.
+
+Event sources are iterators of (event, data) pairs; data is JSON-encoded.
+
+    SSE_COALESCE_MS        token window in milliseconds (default 30, 0 sends every token)
+    SSE_COALESCE_BYTES     flush earlier once this many bytes are buffered (default 256)
+    SSE_HEARTBEAT_SECONDS  idle time before a heartbeat comment (default 15)
+"""
+import asyncio
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+
+COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_MS", "30")) / 1000
+COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Ask nginx & co. not to buffer the body; SSE is useless if it arrives in one piece
+HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+HEARTBEAT = ": ping\n\n"
+
+_END = object()
+
+
+def wants_sse(data, accept=""):
+    """SSE when the body says "format": "sse" or the client accepts text/event-stream."""
+    return data.get("format") == "sse" or "text/event-stream" in (accept or "")
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.tokens = 0
+        self.token_events = 0
+        self.heartbeats = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "tokens": self.tokens,
+                "token_events": self.token_events,
+                # average LLM tokens per token event (1.0 = no coalescing)
+                "coalescing_ratio": round(self.tokens / self.token_events, 2) if self.token_events else None,
+                "heartbeats": self.heartbeats,
+                "window_ms": COALESCE_SECONDS * 1000,
+                "max_bytes": COALESCE_BYTES,
+            }
+
+
+_stats = _Stats()
+
+
+def stats():
+    return _stats.snapshot()
+
+
+class _Coalescer:
+    """Token buffer shared by the sync and async writers; returns the frames to send."""
+
+    def __init__(self, window, max_bytes):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.size = 0
+        self.deadline = None
+        self.started = False
+        self.tokens = 0
+        self.events = 0
+
+    def token(self, text, now):
+        self.parts.append(text)
+        self.size += len(text.encode("utf-8"))
+        self.tokens += 1
+        if not self.started or self.window <= 0 or self.size >= self.max_bytes:
+            self.started = True
+            return self.flush()
+        if self.deadline is None:
+            self.deadline = now + self.window
+        return ""
+
+    def due(self, now):
+        return self.flush() if self.deadline is not None and now >= self.deadline else ""
+
+    def flush(self):
+        if not self.parts:
+            return ""
+        frame = format_event("token", "".join(self.parts))
+        self.parts, self.size, self.deadline = [], 0, None
+        self.events += 1
+        return frame
+
+    def frame(self, event, data, now):
+        if event == "token":
+            return self.token(data, now)
+        return self.flush() + format_event(event, data)
+
+
+def _timeout(coalescer, last_write, heartbeat, now):
+    deadline = last_write + heartbeat
+    if coalescer.deadline is not None:
+        deadline = min(deadline, coalescer.deadline)
+    return max(deadline - now, 0.0)
+
+
+def sse_stream(events, window=None, max_bytes=None, heartbeat=None):
+    """
+    SSE body for a (blocking) event iterator. The iterator runs in a helper thread with the
+    caller's context (request metrics), so flushes and heartbeats go out on time even while
+    it blocks on the LLM.
+    """
+    window = COALESCE_SECONDS if window is None else window
+    max_bytes = COALESCE_BYTES if max_bytes is None else max_bytes
+    heartbeat = HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    pending = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in events:
+                pending.put(item)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            pending.put(("error", {"message": str(e)}))
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+            pending.put(_END)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                     name="sse-producer", daemon=True).start()
+    coalescer = _Coalescer(window, max_bytes)
+    heartbeats = 0
+    last_write = time.monotonic()
+    try:
+        while True:
+            try:
+                item = pending.get(timeout=_timeout(coalescer, last_write, heartbeat, time.monotonic()))
+            except queue.Empty:
+                now = time.monotonic()
+                frame = coalescer.due(now)
+                if not frame and now - last_write >= heartbeat:
+                    frame = HEARTBEAT
+                    heartbeats += 1
+                if frame:
+                    last_write = now
+                    yield frame
+                continue
+            if item is _END:
+                frame = coalescer.flush()
+                if frame:
+                    yield frame
+                return
+            frame = coalescer.frame(*item, time.monotonic())
+            if frame:
+                last_write = time.monotonic()
+                yield frame
+    finally:
+        stop.set()
+        _stats.add(streams=1, tokens=coalescer.tokens, token_events=coalescer.events, heartbeats=heartbeats)
+
+
+async def asse_stream(events, window=None, max_bytes=None, heartbeat=None):
+    """sse_stream() for an async event iterator (the Quart app)."""
+    window = COALESCE_SECONDS if window is None else window
+    max_bytes = COALESCE_BYTES if max_bytes is None else max_bytes
+    heartbeat = HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    pending = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in events:
+                await pending.put(item)
+        except Exception as e:
+            await pending.put(("error", {"message": str(e)}))
+        finally:
+            await pending.put(_END)
+
+    producer = asyncio.ensure_future(produce())
+    coalescer = _Coalescer(window, max_bytes)
+    heartbeats = 0
+    loop = asyncio.get_running_loop()
+    last_write = loop.time()
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(
+                    pending.get(), _timeout(coalescer, last_write, heartbeat, loop.time())
+                )
+            except asyncio.TimeoutError:
+                now = loop.time()
+                frame = coalescer.due(now)
+                if not frame and now - last_write >= heartbeat:
+                    frame = HEARTBEAT
+                    heartbeats += 1
+                if frame:
+                    last_write = now
+                    yield frame
+                continue
+            if item is _END:
+                frame = coalescer.flush()
+                if frame:
+                    yield frame
+                return
+            frame = coalescer.frame(*item, loop.time())
+            if frame:
+                last_write = loop.time()
+                yield frame
+    finally:
+        producer.cancel()
+        _stats.add(streams=1, tokens=coalescer.tokens, token_events=coalescer.events, heartbeats=heartbeats)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The backend is a flat set of modules; tests import them the way the servers do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the apps must not reach OpenAI or Qdrant
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("REALTIME_POOL_SIZE", "0")
+os.environ.setdefault("SEARCH_INDEXED_FIELDS", "source:keyword,card_id:integer")
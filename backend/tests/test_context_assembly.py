@@ -0,0 +1,29 @@
+from langchain_core.documents import Document
+
+from context_assembly import ContextAssembler
+
+
+def _doc(text, score):
+    return Document(page_content=text, metadata={"relevance_score": score})
+
+
+def _assemble(*docs):
+    return [d.page_content for d in ContextAssembler(budget_tokens=2000, score_gap=0).assemble(list(docs))]
+
+
+def test_short_dose_lines_shared_by_chunks_are_kept():
+    paracetamol = _doc("Paracetamol\nAdults:\n10 mg\nContraindications:\nliver failure", 0.9)
+    ibuprofen = _doc("Ibuprofen\nAdults:\n10 mg\nContraindications:\nasthma", 0.8)
+    assert _assemble(paracetamol, ibuprofen) == [paracetamol.page_content, ibuprofen.page_content]
+
+
+def test_long_overlap_lines_are_sent_once():
+    overlap = "Patients should bring their referral letter to the first visit."
+    first = _doc(f"The clinic opens at eight.\n{overlap}", 0.9)
+    second = _doc(f"{overlap}\nParking is free for patients.", 0.8)
+    assert _assemble(first, second) == [first.page_content, "Parking is free for patients."]
+
+
+def test_numbers_inside_a_chunk_stay_and_edge_page_numbers_go():
+    chunk = _doc("12\nDose table\n5\n5\n250\n© 2024 ACME\n- 4 -", 0.9)
+    assert _assemble(chunk) == ["Dose table\n5\n5\n250"]
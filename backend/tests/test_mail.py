@@ -0,0 +1,33 @@
+import pytest
+
+import mail
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mail.resend.Emails, "send", lambda params: calls.append(params) or {"id": "1"})
+    return calls
+
+
+def test_contact_sends_through_resend(sent):
+    r = mail.app.test_client().post("/contact", json={"name": "Ann", "email": "ann@example.com", "message": "a\nb"})
+    assert r.status_code == 200
+    assert sent[0]["reply_to"] == "ann@example.com"
+    assert "a<br>b" in sent[0]["html"]
+
+
+def test_contact_requires_all_fields(sent):
+    r = mail.app.test_client().post("/contact", json={"name": "Ann", "email": "", "message": "hi"})
+    assert r.status_code == 400
+    assert not sent
+
+
+def test_contact_reports_resend_failure(monkeypatch):
+    def fail(params):
+        raise RuntimeError("resend down")
+
+    monkeypatch.setattr(mail.resend.Emails, "send", fail)
+    r = mail.app.test_client().post("/contact", json={"name": "Ann", "email": "ann@example.com", "message": "hi"})
+    assert r.status_code == 500
+    assert r.get_json()["success"] is False
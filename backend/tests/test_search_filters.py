@@ -0,0 +1,57 @@
+import pytest
+
+from retrieval import filter_conditions, metadata_filter
+
+ALLOWED = {"source", "card_id"}
+
+
+@pytest.mark.parametrize("value", ["handbook.pdf", 3, True, ["a.pdf", "b.pdf"], [1, 2]])
+def test_accepted_values_build_a_qdrant_filter(value):
+    conditions, error = filter_conditions({"source": value}, ALLOWED)
+    assert error is None
+    assert metadata_filter(conditions) is not None
+
+
+@pytest.mark.parametrize("value", [1.5, [1.5], [True, False], [1, "a"], [], {"$ne": 1}, None, [["a"]]])
+def test_values_qdrant_rejects_are_client_errors(value):
+    conditions, error = filter_conditions({"source": value}, ALLOWED)
+    assert conditions is None
+    assert error.startswith("filter.source must be")
+
+
+def test_unknown_field_is_rejected():
+    _, error = filter_conditions({"secret": "x"}, ALLOWED)
+    assert error.startswith("Unsupported filter field: secret")
+
+
+def test_no_filter():
+    assert filter_conditions(None, ALLOWED) == (None, None)
+    assert filter_conditions({}, ALLOWED) == (None, None)
+    assert filter_conditions(["source"], ALLOWED)[1] == "filter must be an object of metadata field -> value"
+
+
+@pytest.fixture(scope="module")
+def voice():
+    import voice
+
+    return voice
+
+
+@pytest.mark.parametrize("value", [1.5, [1.5], [True, False], [1, "a"]])
+def test_search_routes_return_400(voice, value):
+    client = voice.app.test_client()
+    r = client.post("/api/search", json={"query": "dose", "filter": {"card_id": value}})
+    assert r.status_code == 400
+    r = client.post("/api/search/batch", json={"queries": ["dose"], "filter": {"card_id": value}})
+    assert r.status_code == 400
+    r = client.post("/api/search/batch", json={"queries": [{"query": "dose", "filter": {"card_id": value}}]})
+    assert r.status_code == 400
+
+
+def test_parse_search_keeps_valid_filter(voice):
+    params, error = voice.parse_search({"query": "dose", "filter": {"card_id": [1, 2]}})
+    assert error is None
+    assert params["filter"] == {"card_id": [1, 2]}
+    queries, error = voice.parse_search_batch({"queries": ["dose"], "filter": {"source": "a.pdf"}})
+    assert error is None
+    assert queries == [("dose", 3, {"source": "a.pdf"})]
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from speech_pipeline import aspeak_while_streaming, speak_while_streaming
+
+ANSWER = ["The clinic opens at eight in the morning. ", "Bring your referral letter with you."]
+
+
+def _events(tokens, error=None):
+    for token in tokens:
+        yield "token", token
+    if error:
+        yield "error", {"message": error}
+    yield "done", {}
+
+
+def _synthesize(spoken, fail=()):
+    def synthesize(sentence):
+        spoken.append(sentence)
+        if sentence in fail:
+            raise RuntimeError("tts down")
+        return sentence.encode()
+    return synthesize
+
+
+def test_errors_are_passed_on_and_never_spoken():
+    spoken = []
+    with ThreadPoolExecutor(2) as executor:
+        events = list(speak_while_streaming(_events(ANSWER, error="qdrant down"), _synthesize(spoken), executor))
+    assert ("error", {"message": "qdrant down"}) in events
+    assert not any("qdrant" in sentence for sentence in spoken)
+    assert [e[0] for e in events].count("audio") == 2
+
+
+def test_failed_sentence_yields_audio_error_and_text_continues():
+    spoken = []
+    first = "The clinic opens at eight in the morning."
+    with ThreadPoolExecutor(2) as executor:
+        events = list(speak_while_streaming(_events(ANSWER), _synthesize(spoken, fail={first}), executor))
+    kinds = [e[0] for e in events]
+    assert kinds.count("text") == 2
+    assert ("audio_error", 0) == events[kinds.index("audio_error")][:2]
+    assert kinds.count("audio") == 1
+
+
+def test_async_pipeline_matches():
+    async def events():
+        for item in _events(ANSWER, error="qdrant down"):
+            yield item
+
+    async def synthesize(sentence):
+        if sentence.startswith("Bring"):
+            raise RuntimeError("tts down")
+        return sentence.encode()
+
+    async def collect():
+        return [e async for e in aspeak_while_streaming(events(), synthesize)]
+
+    kinds = [e[0] for e in asyncio.run(collect())]
+    assert kinds == ["text", "text", "error", "done", "audio", "audio_error"]
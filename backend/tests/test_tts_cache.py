@@ -0,0 +1,21 @@
+import os
+
+from tts_cache import TTSCache
+
+
+def test_open_handle_survives_eviction(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    cache.put("hello", "tts-1", "fable", "mp3", b"audio")
+    fp = cache.open("hello", "tts-1", "fable", "mp3")
+    os.remove(cache.path("hello", "tts-1", "fable", "mp3"))  # another worker evicts it
+    with fp:
+        assert fp.read() == b"audio"
+    assert cache.stats()["hits"] == 1
+
+
+def test_open_after_eviction_is_a_miss(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    cache.put("hello", "tts-1", "fable", "mp3", b"audio")
+    os.remove(cache.path("hello", "tts-1", "fable", "mp3"))
+    assert cache.open("hello", "tts-1", "fable", "mp3") is None
+    assert cache.stats()["misses"] == 1
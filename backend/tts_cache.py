@@ -0,0 +1,221 @@
+"""
+Content-addressed disk cache for synthesized speech.
+
+Audio is stored under sha256(text, model, voice, format), so identical requests from any
+worker share one file. Writes go to a temp file and are renamed into place, which keeps
+concurrent workers from ever reading a partial file. The cache is trimmed back under
+max_bytes by evicting the least recently used files (hits refresh the file mtime).
+File and byte totals are running counters, set by a directory scan at startup and on
+every eviction pass and updated on each write, so stats() never walks the cache.
+
+Pre-warm known phrases (one per line) ahead of time:
+
+    python tts_cache.py prewarm phrases.txt --voice fable --format mp3
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+log = logging.getLogger("tts-cache")
+
+
+class TTSCache:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, evict_interval=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        os.makedirs(directory, exist_ok=True)
+        self._count_files(list(self._files()))
+
+    def _count_files(self, files):
+        # Resync from a full scan; other workers writing to the same directory drift the counters
+        with self._lock:
+            self._files_total = len(files)
+            self._bytes_total = sum(size for _, size, _ in files)
+
+    @staticmethod
+    def key(text, model, voice, fmt):
+        raw = json.dumps([text, model, voice, fmt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, text, model, voice, fmt):
+        digest = self.key(text, model, voice, fmt)
+        return os.path.join(self.directory, digest[:2], f"{digest}.{fmt}")
+
+    def get(self, text, model, voice, fmt):
+        """Return the cached file path, or None on a miss."""
+        path = self.path(text, model, voice, fmt)
+        try:
+            os.utime(path)  # refresh recency for LRU eviction
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return path
+
+    def open(self, text, model, voice, fmt):
+        """
+        Return the cached file opened for reading, or None on a miss. Unlike get(), the
+        handle stays readable if another worker evicts the file after the lookup.
+        """
+        path = self.path(text, model, voice, fmt)
+        try:
+            fp = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+        try:
+            os.utime(path)  # refresh recency for LRU eviction
+        except FileNotFoundError:
+            pass  # evicted since the open; the handle still reads the whole file
+        with self._lock:
+            self._hits += 1
+        return fp
+
+    def put(self, text, model, voice, fmt, data):
+        path = self.path(text, model, voice, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            previous = os.stat(path).st_size
+        except FileNotFoundError:
+            previous = None
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            if previous is None:
+                self._files_total += 1
+            self._bytes_total += len(data) - (previous or 0)
+        self._maybe_evict()
+        return path
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_evict < self.evict_interval:
+                return
+            self._last_evict = now
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the cache fits in max_bytes."""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        kept = 0
+        for i, (_, size, path) in enumerate(files):
+            if total <= self.max_bytes:
+                kept = len(files) - i
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # another worker got there first
+            total -= size
+            with self._lock:
+                self._evicted += 1
+        with self._lock:
+            self._files_total = kept
+            self._bytes_total = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": self._files_total,
+                "bytes": self._bytes_total,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evicted": self._evicted,
+            }
+
+
+def synthesize(client, text, model="tts-1", voice="fable", fmt="mp3"):
+    with client.audio.speech.with_streaming_response.create(
+        model=model, voice=voice, input=text, response_format=fmt,
+    ) as response:
+        return response.read()
+
+
+def create_tts_cache():
+    """Cache configured by TTS_CACHE_DIR / TTS_CACHE_MAX_MB, or None when TTS_CACHE_ENABLED=0."""
+    if os.getenv("TTS_CACHE_ENABLED", "1") != "1":
+        return None
+    return TTSCache(
+        os.getenv("TTS_CACHE_DIR", "tts_cache"),
+        max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    )
+
+
+def prewarm(cache, client, phrases, model, voice, fmt):
+    for text in phrases:
+        if cache.get(text, model, voice, fmt):
+            log.info("cached: %r", text[:60])
+            continue
+        cache.put(text, model, voice, fmt, synthesize(client, text, model, voice, fmt))
+        log.info("synthesized: %r", text[:60])
+
+
+def main():
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    parser = argparse.ArgumentParser(description="TTS audio cache tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("prewarm", help="synthesize phrases (one per line) into the cache")
+    warm.add_argument("phrases", help="text file with one phrase per line")
+    warm.add_argument("--model", default="tts-1")
+    warm.add_argument("--voice", action="append", help="repeat for several voices (default: fable)")
+    warm.add_argument("--format", action="append", dest="formats",
+                      help="repeat for several formats (default: mp3)")
+    sub.add_parser("stats", help="print cache size and counters")
+    sub.add_parser("evict", help="trim the cache to TTS_CACHE_MAX_MB now")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    cache = create_tts_cache() or TTSCache(os.getenv("TTS_CACHE_DIR", "tts_cache"))
+
+    if args.command == "prewarm":
+        with open(args.phrases, encoding="utf-8") as fp:
+            phrases = [line.strip() for line in fp if line.strip()]
+        client = OpenAI()
+        for voice in args.voice or ["fable"]:
+            for fmt in args.formats or ["mp3"]:
+                prewarm(cache, client, phrases, args.model, voice, fmt)
+    elif args.command == "evict":
+        cache.evict()
+    print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
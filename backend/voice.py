@@ -1,14 +1,20 @@
 from flask import Flask, request, Response, jsonify
 from flask_cors import CORS
-import requests
 import os
 import json
 import logging
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import Qdrant
-import qdrant_client
 from prompts.system_prompt import SYSTEM_PROMPT
+from embedding_cache import get_embeddings
+from http_pool import get_http_client
+from realtime_pool import RealtimeSessionPool, RealtimeSessionError
+from retrieval import (
+    RETRIEVAL_MODES, VectorRetriever, create_payload_indexes, filter_conditions, mmr_settings, payload_fields,
+)
+from sparse_index import create_sparse_index
+from local_replica import create_local_replica
+from metrics import instrument_flask, registry, stage, upstream_error
+from warmup import Lazy, WarmUp
 
 # Load environment variables from .env
 load_dotenv()
@@ -30,33 +36,61 @@ CORS(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-route / per-stage latency histograms at GET /metrics (see metrics.py)
+instrument_flask(app)
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.error("OPENAI_API_KEY not set.")
     raise EnvironmentError("OPENAI_API_KEY environment variable not set.")
 
-OPENAI_SESSION_URL = "https://api.openai.com/v1/realtime/sessions"
-OPENAI_API_URL = "https://api.openai.com/v1/realtime"
+# OPENAI_BASE_URL (also honoured by the OpenAI SDK) can point at a local stand-in
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_SESSION_URL = f"{OPENAI_BASE_URL}/realtime/sessions"
+OPENAI_API_URL = f"{OPENAI_BASE_URL}/realtime"
 MODEL_ID = "gpt-4o-realtime-preview-2024-12-17"
 VOICE = "ballad"
 DEFAULT_INSTRUCTIONS = SYSTEM_PROMPT
 
+# Pooled keep-alive session for the realtime session + SDP calls
+http_client = get_http_client()
+
 
 def get_vector_store():
+    import qdrant_client
+    from langchain_qdrant import QdrantVectorStore
+
     client = qdrant_client.QdrantClient(
         url=os.getenv("QDRANT_HOST"),
         api_key=os.getenv("QDRANT_API_KEY"),
     )
-    embeddings = OpenAIEmbeddings()
-    vector_store = Qdrant(
+    embeddings = get_embeddings()
+    # QdrantVectorStore (query_points) rather than the deprecated Qdrant wrapper, whose
+    # client.search call no longer exists in current qdrant-client releases
+    vector_store = QdrantVectorStore(
         client=client,
         collection_name=os.getenv("QDRANT_COLLECTION_NAME"),
-        embeddings=embeddings,
+        embedding=embeddings,
     )
     return vector_store
 
 
-vector_store = get_vector_store()
+# Connects to Qdrant on first use (or during warm-up), not at import
+vector_store = Lazy(get_vector_store)
+# LOCAL_REPLICA_PATH: search a synced in-process copy of the collection instead of Qdrant
+replica = create_local_replica()
+# Metadata fields searches may filter on, each with a Qdrant payload index
+# (SEARCH_INDEXED_FIELDS, default "source:keyword"); filters on other fields get a 400
+payload_indexes = create_payload_indexes(vector_store)
+# BM25 keyword index for "mode": "sparse" / "hybrid" searches, built on first use
+sparse_index = create_sparse_index(vector_store, replica)
+# Embeds and searches as separate timed stages (embedding, qdrant, bm25);
+# RETRIEVAL_MODE sets the default mode, requests can override it with "mode";
+# RETRIEVAL_MMR / MMR_LAMBDA / DEDUP_THRESHOLD configure re-ranking, overridable with "mmr"
+search_retriever = VectorRetriever(
+    vector_store=vector_store, k=3, mode=os.getenv("RETRIEVAL_MODE", "dense"), sparse_index=sparse_index,
+    replica=replica, embeddings=get_embeddings(), payload_indexes=payload_indexes, **mmr_settings(),
+)
 
 
 @app.route("/")
@@ -309,6 +343,88 @@ TOOLS = [
 ]
 
 
+# Realtime session with instructions + tools, created in step 1 of connect_rtc.
+REALTIME_SESSION_PAYLOAD = {
+    "model": MODEL_ID,
+    "voice": VOICE,
+    "instructions": (
+        DEFAULT_INSTRUCTIONS + "\n\n"
+        "If the user wants to send an email via the Contact section, ask for any missing fields "
+        "(name, email, recipient if needed, and message). After confirming, call contact_fill with the collected "
+        "values, then call contact_submit to send. When the user asks you to open pages, click buttons, "
+        "or type into the chatbot, use the provided tools strictly with the allowed values."
+        "If the user asks to open or close the chatbot, call set_chat_visible with visible=true or visible=false respectively."
+        "if the user asks you to go the About section, use the navigate_to tool with section='about'. which is the top of the platform."
+        "If the user indicates they want to dismiss the assistant (e.g., “go now”, “go for now”, “thank you for now”, “you can go”, “dismiss”, “close assistant”, “hide”, “bye for now”),call assistant_close with no arguments.Do not ask for confirmation "
+        """When the user asks to show or play a tutorial video (e.g., “show me the Doctor AI tutorial”, 
+            “play the transcription tutorial”), call the function tutorial_play with the proper id:
+
+            - "Doctor AI" -> id "doctorai"
+            - "Transcription App" -> id "transcription"
+            - "Medical Reports Platform" -> id "medreport"
+            - "IVF Assistant" -> id "ivf"
+            - "Meeting Assistant" -> id "meeting"
+
+            Prefer calling tutorial_play over describing how to open the video.
+            If the user says “open it fullscreen”, pass open_modal=true."""
+            "if your are on the product section and the user asks you to play a video about a specific application use the help video button to play the video by using the help video button on the product card not the tutorial video on tutorial section."
+    ),
+    "tools": TOOLS,
+    "tool_choice": "auto",
+    "turn_detection": {"type": "server_vad"},
+}
+
+
+# Keeps REALTIME_POOL_SIZE unexpired realtime sessions ready (0 disables pre-warming)
+realtime_pool = RealtimeSessionPool(
+    http_client,
+    OPENAI_SESSION_URL,
+    {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+    REALTIME_SESSION_PAYLOAD,
+    size=int(os.getenv("REALTIME_POOL_SIZE", "1")),
+    margin=float(os.getenv("REALTIME_POOL_MARGIN", "15")),
+    name="realtime",
+)
+
+
+registry.register_collector("http_pool", http_client.stats)
+registry.register_collector("embedding_cache", get_embeddings().stats)
+registry.register_collector("realtime_pool", realtime_pool.stats)
+registry.register_collector("voice_sparse_index", sparse_index.stats)
+if replica:
+    registry.register_collector("voice_local_replica", replica.stats)
+
+
+# Builds the vector store and starts the session pool right after start; /api/ready
+# answers 503 until that has succeeded (see warmup.py)
+warmup = WarmUp("voice")
+warmup.step("embeddings", lambda: get_embeddings().embed_query("warm-up"))
+if replica:
+    warmup.step("replica", lambda: replica.get() or vector_store.get())
+else:
+    warmup.step("qdrant", vector_store.get)
+warmup.step("realtime_pool", realtime_pool.start)
+if payload_indexes.fields and not replica:
+    warmup.step("payload_indexes", payload_indexes.ensure_configured)
+if search_retriever.mode != "dense":
+    warmup.step("bm25", sparse_index.get)
+
+
+@app.before_request
+def start_warmup():
+    warmup.ensure_started()
+
+
+@app.route("/api/ready", methods=["GET"])
+def ready():
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+
+@app.route("/api/realtime-pool/stats", methods=["GET"])
+def realtime_pool_stats():
+    return jsonify(realtime_pool.stats())
+
+
 @app.route("/api/rtc-connect", methods=["POST"])
 def connect_rtc():
     try:
@@ -321,72 +437,31 @@ def connect_rtc():
             request.args.get("session_id") or request.headers.get("X-Session-Id") or ""
         )
 
-        # 1) Create the Realtime session with instructions + tools.
-        session_payload = {
-            "model": MODEL_ID,
-            "voice": VOICE,
-            "instructions": (
-                DEFAULT_INSTRUCTIONS + "\n\n"
-                "If the user wants to send an email via the Contact section, ask for any missing fields "
-                "(name, email, recipient if needed, and message). After confirming, call contact_fill with the collected "
-                "values, then call contact_submit to send. When the user asks you to open pages, click buttons, "
-                "or type into the chatbot, use the provided tools strictly with the allowed values."
-                "If the user asks to open or close the chatbot, call set_chat_visible with visible=true or visible=false respectively."
-                "if the user asks you to go the About section, use the navigate_to tool with section='about'. which is the top of the platform."
-                "If the user indicates they want to dismiss the assistant (e.g., “go now”, “go for now”, “thank you for now”, “you can go”, “dismiss”, “close assistant”, “hide”, “bye for now”),call assistant_close with no arguments.Do not ask for confirmation "
-                """When the user asks to show or play a tutorial video (e.g., “show me the Doctor AI tutorial”, 
-                    “play the transcription tutorial”), call the function tutorial_play with the proper id:
-
-                    - "Doctor AI" -> id "doctorai"
-                    - "Transcription App" -> id "transcription"
-                    - "Medical Reports Platform" -> id "medreport"
-                    - "IVF Assistant" -> id "ivf"
-                    - "Meeting Assistant" -> id "meeting"
-
-                    Prefer calling tutorial_play over describing how to open the video.
-                    If the user says “open it fullscreen”, pass open_modal=true."""
-                    "if your are on the product section and the user asks you to play a video about a specific application use the help video button to play the video by using the help video button on the product card not the tutorial video on tutorial section."
-            ),
-            "tools": TOOLS,
-            "tool_choice": "auto",
-            "turn_detection": {"type": "server_vad"},
-        }
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        session_resp = requests.post(
-            OPENAI_SESSION_URL, headers=headers, json=session_payload, timeout=30
-        )
-        if not session_resp.ok:
-            logger.error(
-                f"Session create failed: {session_resp.status_code} {session_resp.text}"
-            )
+        # 1) Realtime session with instructions + tools (pre-warmed by realtime_pool when possible)
+        try:
+            with stage("session"):
+                ephemeral_token = realtime_pool.acquire()
+        except RealtimeSessionError as e:
+            logger.error(f"Session create failed: {e}")
             return Response(
                 "Failed to create realtime session", status=500, mimetype="text/plain"
             )
 
-        token_data = session_resp.json()
-        ephemeral_token = token_data.get("client_secret", {}).get("value")
-        if not ephemeral_token:
-            logger.error("Ephemeral token missing")
-            return Response(
-                "Missing ephemeral token", status=500, mimetype="text/plain"
-            )
-
         # 2) SDP exchange
         sdp_headers = {
             "Authorization": f"Bearer {ephemeral_token}",
             "Content-Type": "application/sdp",
         }
-        sdp_resp = requests.post(
-            OPENAI_API_URL,
-            headers=sdp_headers,
-            params={"model": MODEL_ID, "voice": VOICE},
-            data=client_sdp,
-            timeout=60,
-        )
+        with stage("sdp_exchange"):
+            sdp_resp = http_client.post(
+                OPENAI_API_URL,
+                headers=sdp_headers,
+                params={"model": MODEL_ID, "voice": VOICE},
+                data=client_sdp,
+                timeout=60,
+            )
         if not sdp_resp.ok:
+            upstream_error("sdp_exchange")
             logger.error(f"SDP exchange failed: {sdp_resp.status_code} {sdp_resp.text}")
             return Response("SDP exchange error", status=500, mimetype="text/plain")
 
@@ -397,31 +472,153 @@ def connect_rtc():
         return Response(f"Error: {e}", status=500, mimetype="text/plain")
 
 
+def format_results(results, fields=None):
+    """Hits as JSON; with a `fields` projection, "content" is only present when requested."""
+    hits = []
+    for doc, score in results:
+        hit = {"content": doc.page_content} if fields is None or "content" in fields else {}
+        hit["metadata"] = doc.metadata
+        hit["relevance_score"] = float(score)
+        hits.append(hit)
+    return hits
+
+
+SEARCH_MAX_K = 50
+
+
+def parse_search(data):
+    """
+    Returns (search kwargs, error) for a /api/search body:
+      {"query": "...", "k": 5, "score_threshold": 0.75, "filter": {"source": "handbook.pdf"},
+       "fields": ["content", "source"], "mode": "hybrid", "mmr": true}
+    Everything but "query" is optional; "fields" lists metadata keys (plus "content" for the
+    chunk text) and trims what Qdrant sends back.
+    """
+    query = (data.get("query") or "").strip()
+    if not query:
+        return None, "No query provided"
+    mode = data.get("mode")
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        return None, f"Unsupported mode: {mode} (use one of {', '.join(RETRIEVAL_MODES)})"
+    mmr = data.get("mmr")
+    if mmr is not None and not isinstance(mmr, bool):
+        return None, "mmr must be true or false"
+    k = data.get("k", 3)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= SEARCH_MAX_K:
+        return None, f"k must be an integer between 1 and {SEARCH_MAX_K}"
+    score_threshold = data.get("score_threshold")
+    if score_threshold is not None and (
+        not isinstance(score_threshold, (int, float)) or isinstance(score_threshold, bool)
+    ):
+        return None, "score_threshold must be a number"
+    filter, error = filter_conditions(data.get("filter"), payload_indexes.fields)
+    if error:
+        return None, error
+    fields, error = payload_fields(data.get("fields"))
+    if error:
+        return None, error
+    return {"query": query, "k": k, "score_threshold": score_threshold, "filter": filter,
+            "fields": fields, "mode": mode, "mmr": mmr}, None
+
+
 @app.route("/api/search", methods=["POST"])
 def search():
     try:
-        query = request.json.get("query")
-        if not query:
-            return jsonify({"error": "No query provided"}), 400
-
-        logger.info(f"Searching for: {query}")
-        results = vector_store.similarity_search_with_score(query, k=3)
-
-        formatted = [
-            {
-                "content": doc.page_content,
-                "metadata": doc.metadata,
-                "relevance_score": float(score),
-            }
-            for doc, score in results
-        ]
+        params, error = parse_search(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
 
-        return jsonify({"results": formatted})
+        logger.info(f"Searching for: {params['query']}")
+        results = search_retriever.search(**params)
+
+        return jsonify({"results": format_results(results, params["fields"])})
 
     except Exception as e:
         logger.error(f"Search error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+# Several lookups in one request: one embeddings call and one Qdrant batch query.
+#   {"queries": ["...", {"query": "...", "k": 5, "filter": {"source": "handbook.pdf"}}], "k": 3,
+#    "mode": "hybrid", "mmr": true}
+# k and filter may be set per query or once for the whole batch; mode and mmr are per batch.
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "32"))
+
+
+def parse_search_batch(data):
+    """Returns ([(query, k, filter)], error) for a /api/search/batch body."""
+    if data.get("mode") is not None and data["mode"] not in RETRIEVAL_MODES:
+        return None, f"Unsupported mode: {data['mode']} (use one of {', '.join(RETRIEVAL_MODES)})"
+    if data.get("mmr") is not None and not isinstance(data["mmr"], bool):
+        return None, "mmr must be true or false"
+    items = data.get("queries")
+    if not isinstance(items, list) or not items:
+        return None, "No queries provided"
+    if len(items) > SEARCH_BATCH_MAX:
+        return None, f"At most {SEARCH_BATCH_MAX} queries per batch"
+    queries = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict) or not (item.get("query") or "").strip():
+            return None, "Every query needs a non-empty 'query'"
+        k = item.get("k", data.get("k", 3))
+        if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= SEARCH_MAX_K:
+            return None, f"k must be an integer between 1 and {SEARCH_MAX_K}"
+        filter, error = filter_conditions(item.get("filter", data.get("filter")), payload_indexes.fields)
+        if error:
+            return None, error
+        queries.append((item["query"].strip(), k, filter))
+    return queries, None
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def search_batch():
+    data = request.get_json(silent=True) or {}
+    queries, error = parse_search_batch(data)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        logger.info(f"Batch search: {len(queries)} queries")
+        batches = search_retriever.search_batch(queries, mode=data.get("mode"), mmr=data.get("mmr"))
+        return jsonify({
+            "results": [
+                {"query": query, "results": format_results(results)}
+                for (query, _, _), results in zip(queries, batches)
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Batch search error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/sparse-index/stats", methods=["GET"])
+def sparse_index_stats():
+    return jsonify(sparse_index.stats())
+
+
+@app.route("/api/payload-indexes/stats", methods=["GET"])
+def payload_indexes_stats():
+    return jsonify(payload_indexes.stats())
+
+
+@app.route("/api/local-replica/stats", methods=["GET"])
+def local_replica_stats():
+    return jsonify(replica.stats() if replica else {"enabled": False})
+
+
+@app.route("/api/http-pool/stats", methods=["GET"])
+def http_pool_stats():
+    return jsonify(http_client.stats())
+
+
+@app.route("/api/embedding-cache/stats", methods=["GET"])
+def embedding_cache_stats():
+    return jsonify(get_embeddings().stats())
+
+
+warmup.ensure_started()
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=8813)
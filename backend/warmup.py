@@ -0,0 +1,120 @@
+"""
+Lazy construction of expensive clients and an explicit warm-up stage.
+
+Importing app.py / voice.py used to build the RAG chain and connect to Qdrant on the spot,
+so boot was slow and a Qdrant hiccup crashed it. Heavy objects are now `Lazy` proxies built
+on first use, and `WarmUp` builds them (plus a few cache-priming calls) in a background
+thread right after start. Failed steps are retried with backoff, and `ready` only turns
+true once every step has succeeded; that is what the /api/ready probe reports.
+
+    WARMUP_ENABLED=0     skip warm-up (everything is built on first use; /api/ready is always ready)
+    WARMUP_QUERIES       file with one question per line to embed up front
+"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("warmup")
+
+_UNSET = object()
+
+
+class Lazy:
+    """Calls `factory()` on first use (once, thread-safe) and forwards attribute access to the result."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+        return self._value
+
+    @property
+    def built(self):
+        return self._value is not _UNSET
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def read_queries(path=None):
+    """Non-empty lines of WARMUP_QUERIES (or `path`), [] when unset or missing."""
+    path = path or os.getenv("WARMUP_QUERIES")
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+class WarmUp:
+    def __init__(self, name="warmup", enabled=None, max_backoff=30.0):
+        self.name = name
+        self.enabled = os.getenv("WARMUP_ENABLED", "1") == "1" if enabled is None else enabled
+        self.max_backoff = max_backoff
+        self._steps = []  # (name, fn) in registration order
+        self._results = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._started_at = None
+        self._finished_at = None
+
+    def step(self, name, fn):
+        """Register fn() as a warm-up step; steps run in registration order."""
+        self._steps.append((name, fn))
+        self._results[name] = {"ok": False, "attempts": 0, "seconds": None, "error": None}
+
+    def ensure_started(self):
+        # Per process, like RealtimeSessionPool: a thread started before a gunicorn fork is lost.
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._started_at = time.time()
+            self._finished_at = None
+        threading.Thread(target=self._run, name=f"{self.name}-warmup", daemon=True).start()
+
+    def _run(self):
+        for name, fn in self._steps:
+            backoff = 1.0
+            while True:
+                start = time.perf_counter()
+                try:
+                    fn()
+                except Exception as e:
+                    with self._lock:
+                        self._results[name]["attempts"] += 1
+                        self._results[name]["error"] = str(e)
+                    log.warning("[%s] %s failed, retrying in %.0fs: %s", self.name, name, backoff, e)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                with self._lock:
+                    result = self._results[name]
+                    result.update(ok=True, seconds=round(time.perf_counter() - start, 3), error=None)
+                    result["attempts"] += 1
+                break
+        with self._lock:
+            self._finished_at = time.time()
+        log.info("[%s] ready in %.2fs", self.name, self._finished_at - self._started_at)
+
+    @property
+    def ready(self):
+        return not self.enabled or self._finished_at is not None
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "enabled": self.enabled,
+                "seconds": round((self._finished_at or time.time()) - self._started_at, 3)
+                if self._started_at else None,
+                "steps": {name: dict(result) for name, result in self._results.items()},
+            }